@@ -0,0 +1,246 @@
+import argparse
+import csv
+import json
+import statistics
+import sys
+import time
+from dataclasses import asdict, dataclass, field
+from itertools import product
+
+import dlx
+from board import Board
+from encoder import Encoder, amo_encodings
+from placement_encoder import PlacementEncoder
+from solvers import backends, make_backend
+
+encoders = {"parts": Encoder, "placements": PlacementEncoder}
+
+# metrics that are compared against the baseline: sizes must not grow, times may grow by at most
+# the tolerance (and by more than min_time_delta seconds, to ignore noise on tiny cases).
+size_metrics = ["num_vars", "num_clauses", "dimacs_bytes"]
+time_metrics = ["encode_time", "dimacs_time", "first_solution_time", "next_solution_time"]
+min_time_delta = 0.05
+
+
+@dataclass
+class Case:
+    """ One point of the benchmark sweep. """
+    width: int
+    height: int
+    pieces: str  # 'all', or a list of piece ids like '0-4' or '0,3,5'
+    encoder: str
+    cell_amo: str
+    part_amo: str
+    symmetry_breaking: bool
+    backend: str  # backend kind, optionally with a solver: 'pysat:glucose4', or 'dlx'
+
+    @property
+    def key(self) -> str:
+        return f"{self.width}x{self.height}/{self.pieces}/{self.encoder}/{self.cell_amo}/" \
+               f"{self.part_amo}/{'sym' if self.symmetry_breaking else 'nosym'}/{self.backend}"
+
+
+@dataclass
+class Result:
+    case: Case
+    repetitions: int = 0
+    num_vars: int = 0
+    num_clauses: int = 0
+    dimacs_bytes: int = 0
+    num_solutions: int = 0
+    # medians over the repetitions, in seconds.
+    encode_time: float = 0.0
+    dimacs_time: float = 0.0
+    first_solution_time: float = 0.0
+    next_solution_time: float = 0.0  # average time for each solution after the first.
+    samples: dict = field(default_factory=dict)  # metric -> list of all repetitions.
+
+    def row(self) -> dict:
+        row = {"key": self.case.key}
+        row.update(asdict(self.case))
+        row.update({k: v for k, v in asdict(self).items() if k not in ("case", "samples")})
+        return row
+
+
+class _CountingWriter:
+    """ A text file object that only counts what is written to it. """
+
+    def __init__(self):
+        self.size = 0
+
+    def write(self, s: str):
+        self.size += len(s)
+
+
+def parse_pieces(pieces: str) -> list:
+    if pieces == 'all':
+        return list(range(10))
+    ids = []
+    for part in pieces.split(','):
+        if '-' in part:
+            first, last = map(int, part.split('-'))
+            ids.extend(range(first, last + 1))
+        else:
+            ids.append(int(part))
+    return ids
+
+
+def run_once(case: Case, num_solutions: int) -> dict:
+    """ Runs one repetition of a case and returns its measurements. """
+    board = Board(case.width, case.height, parse_pieces(case.pieces))
+    ret = {}
+    if case.backend == 'dlx':
+        start_time = time.perf_counter()
+        found = 0
+        for _ in dlx.solutions(board, num_solutions, case.symmetry_breaking):
+            found += 1
+            if found == 1:
+                ret["first_solution_time"] = time.perf_counter() - start_time
+        total = time.perf_counter() - start_time
+        ret.update(num_vars=0, num_clauses=0, dimacs_bytes=0, encode_time=0.0, dimacs_time=0.0)
+    else:
+        start_time = time.perf_counter()
+        encoder = encoders[case.encoder](board, symmetry_breaking=case.symmetry_breaking,
+                                         cell_amo=case.cell_amo, part_amo=case.part_amo)
+        encoder.encode()
+        ret["encode_time"] = time.perf_counter() - start_time
+        ret["num_vars"] = encoder.num_vars
+        ret["num_clauses"] = len(encoder.constraints)
+
+        start_time = time.perf_counter()
+        writer = _CountingWriter()
+        encoder.write_dimacs(writer)
+        ret["dimacs_time"] = time.perf_counter() - start_time
+        ret["dimacs_bytes"] = writer.size
+
+        kind, _, solver = case.backend.partition(':')
+        backend = make_backend(kind, encoder, solver or None)
+        start_time = time.perf_counter()
+        found = 0
+        result, model = backend.solve()
+        while result == 1:
+            found += 1
+            if found == 1:
+                ret["first_solution_time"] = time.perf_counter() - start_time
+            if found >= num_solutions:
+                break
+            encoder.block_model(model)
+            result, model = backend.solve()
+        total = time.perf_counter() - start_time
+        backend.close()
+    if found == 0:
+        ret["first_solution_time"] = total  # time to prove UNSAT.
+    ret["num_solutions"] = found
+    ret["next_solution_time"] = \
+        (total - ret["first_solution_time"]) / (found - 1) if found > 1 else 0.0
+    return ret
+
+
+def run_case(case: Case, num_solutions: int, repetitions: int) -> Result:
+    result = Result(case, repetitions)
+    for _ in range(repetitions):
+        for metric, value in run_once(case, num_solutions).items():
+            result.samples.setdefault(metric, []).append(value)
+    for metric, values in result.samples.items():
+        if metric in time_metrics:
+            setattr(result, metric, statistics.median(values))
+        else:
+            setattr(result, metric, values[-1])
+    return result
+
+
+def write_results(results: list, filename: str):
+    if filename.endswith('.csv'):
+        with open(filename, 'w', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=list(results[0].row()))
+            writer.writeheader()
+            for result in results:
+                writer.writerow(result.row())
+    else:
+        with open(filename, 'w') as f:
+            json.dump({"results": [dict(result.row(), samples=result.samples)
+                                   for result in results]}, f, indent=2)
+
+
+def compare_to_baseline(results: list, filename: str, tolerance: float) -> list:
+    """ Returns a description of each metric that regressed with respect to the baseline, a
+    JSON file written by a previous run. Cases that are not in the baseline are ignored. """
+    with open(filename) as f:
+        baseline = {row["key"]: row for row in json.load(f)["results"]}
+    regressions = []
+    for result in results:
+        old = baseline.get(result.case.key)
+        if old is None:
+            continue
+        new = result.row()
+        for metric in size_metrics:
+            if new[metric] > old[metric]:
+                regressions.append(f"{result.case.key}: {metric} {old[metric]} -> {new[metric]}")
+        for metric in time_metrics:
+            if new[metric] > old[metric] * (1 + tolerance) and \
+                    new[metric] - old[metric] > min_time_delta:
+                regressions.append(f"{result.case.key}: {metric} {old[metric]:.3f}s -> "
+                                   f"{new[metric]:.3f}s")
+    return regressions
+
+
+def read_cmd_args():
+    argparser = argparse.ArgumentParser(
+        description='Benchmark encodings and solvers over a sweep of boards and options.')
+    argparser.add_argument('--sizes', nargs='+', default=['10x5'],
+                           help='Board sizes, as WIDTHxHEIGHT.')
+    argparser.add_argument('--pieces', nargs='+', default=['all'],
+                           help="Piece sets: 'all', or ids like '0-4' or '0,3,5'.")
+    argparser.add_argument('--encoders', nargs='+', choices=list(encoders),
+                           default=['placements'])
+    argparser.add_argument('--amo', nargs='+', choices=list(amo_encodings), default=['pairwise'],
+                           help='At-most-one encodings (used for both constraint families).')
+    argparser.add_argument('--symmetry', nargs='+', choices=['off', 'on'], default=['off'])
+    argparser.add_argument('--backends', nargs='+', default=['pysat'],
+                           help=f"Backends: {', '.join(backends)}, optionally followed by "
+                                f"':SOLVER', or dlx (no encoding).")
+    argparser.add_argument('-n', '--solutions', type=int, default=10,
+                           help='Number of solutions to enumerate in each run.')
+    argparser.add_argument('-r', '--repeat', type=int, default=3,
+                           help='Repetitions of each case.')
+    argparser.add_argument('-o', '--output', help='Write results to a .json or .csv file.')
+    argparser.add_argument('--baseline', help='Compare with the results in this JSON file.')
+    argparser.add_argument('--tolerance', type=float, default=0.2,
+                           help='Allowed relative slowdown with respect to the baseline.')
+    return argparser.parse_args()
+
+
+def main():
+    args = read_cmd_args()
+    cases = []
+    for size, pieces, encoder, amo, symmetry, backend in \
+            product(args.sizes, args.pieces, args.encoders, args.amo, args.symmetry,
+                    args.backends):
+        width, height = map(int, size.split('x'))
+        if backend == 'dlx':  # no encoding involved
+            encoder = amo = '-'
+        case = Case(width, height, pieces, encoder, amo, amo, symmetry == 'on', backend)
+        if all(c.key != case.key for c in cases):
+            cases.append(case)
+
+    results = []
+    for case in cases:
+        result = run_case(case, args.solutions, args.repeat)
+        results.append(result)
+        print(f"{case.key}: {result.num_vars} vars, {result.num_clauses} clauses, "
+              f"{result.dimacs_bytes} B, encode {result.encode_time:.3f}s, "
+              f"first {result.first_solution_time:.3f}s, "
+              f"next {result.next_solution_time:.3f}s ({result.num_solutions} solutions)")
+
+    if args.output is not None:
+        write_results(results, args.output)
+    if args.baseline is not None:
+        regressions = compare_to_baseline(results, args.baseline, args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if len(regressions) > 0:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
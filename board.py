@@ -1,25 +1,183 @@
-from piece import Piece
+import numpy as np
+
+from piece import Orientation, Piece, load_pieces
+from solution import EMPTY, max_pieces
 
 
 class Board:
-    def __init__(self, width: int, height: int):
+    def __init__(self, width: int, height: int, piece_ids: list = None, mask=None, parity=None,
+                 piece_set: list = None):
+        """ piece_ids are the ids of the pieces to use from piece_set (by default, the standard
+        pieces, see Piece), by default all of them. mask is a height x width array of bools,
+        true for the cells that exist (by default, all of them: a rectangle), and parity tells
+        which cells show an 'O' (by default, those with odd i + j). """
         self.width = width
         self.height = height
         self.max_i = height - 1
         self.max_j = width - 1
         self.pieces = []
+        self._placements = {}  # piece idx -> placements, see placements.
+
+        self.mask = np.ones((height, width), dtype=bool) if mask is None else \
+            np.array(mask, dtype=bool)
+        self.parity = np.indices((height, width)).sum(axis=0) % 2 == 1 if parity is None else \
+            np.array(parity, dtype=bool)
+        assert self.mask.shape == (height, width) and self.parity.shape == (height, width)
+        # cells in row-major order, and the position of each cell in it (-1 if not a cell).
+        self._cells = [(int(i), int(j)) for i, j in zip(*np.nonzero(self.mask))]
+        self.num_cells = len(self._cells)
+        self.cell_index = np.full((height, width), -1, dtype=np.int64)
+        self.cell_index[self.mask] = np.arange(self.num_cells)
+
+        self.piece_set = piece_set if piece_set is not None else load_pieces()
+        self.piece_ids = list(piece_ids) if piece_ids is not None else \
+            list(range(len(self.piece_set)))
+        if len(self.piece_ids) > max_pieces:
+            raise ValueError(f"Boards have at most {max_pieces} pieces (solutions are written with "
+                             f"one digit per cell), not {len(self.piece_ids)}.")
 
         self.init_pieces()
         self.num_pieces = len(self.pieces)
 
+    @classmethod
+    def from_rows(cls, rows: list, piece_ids: list = None, piece_set: list = None) -> "Board":
+        """ Board drawn as rows of X's and O's, with '.' where there is no cell. """
+        rows = [row.strip() for row in rows if len(row.strip()) > 0]
+        width = max(map(len, rows))
+        rows = [row.ljust(width, '.') for row in rows]
+        for row in rows:
+            if set(row) - set('XO.'):
+                raise ValueError(f"Unexpected characters in board row {row}.")
+        mask = [[c != '.' for c in row] for row in rows]
+        parity = [[c == 'O' for c in row] for row in rows]
+        return cls(width, len(rows), piece_ids, mask, parity, piece_set)
+
+    @classmethod
+    def from_file(cls, filename: str, piece_ids: list = None,
+                  piece_set: list = None) -> "Board":
+        """ Board drawn in a text file, as in from_rows. Lines starting with '#' are ignored. """
+        with open(filename) as f:
+            rows = [line for line in f if not line.startswith('#')]
+        return cls.from_rows(rows, piece_ids, piece_set)
+
+    def rows(self) -> list:
+        """ The board drawn as in from_rows. """
+        return [''.join('.' if not self.mask[i, j] else 'O' if self.parity[i, j] else 'X'
+                        for j in range(self.width)) for i in range(self.height)]
+
     def init_pieces(self):
-        for k in range(10):
-            p = Piece(k)
+        for k, piece_id in enumerate(self.piece_ids):
+            p = Piece(k, self.piece_set[piece_id].coords, self.piece_set[piece_id].os)
+            # pieces are numbered by their position in this board.
             self.pieces.append(p)
 
+    def cells(self) -> list:
+        """ Returns the (i, j) of the cells that exist, row by row. """
+        return self._cells
+
+    def is_cell(self, i: int, j: int) -> bool:
+        """ Returns true if (i, j) is a cell of the board. """
+        return self.valid_i(i) and self.valid_j(j) and bool(self.mask[i, j])
+
     def is_o(self, i: int, j: int) -> bool:
         """ Returns true if board position should have a piece with 'O' facing up."""
-        return (i + j) % 2 == 1
+        return bool(self.parity[i, j])
+
+    def symmetries(self) -> list:
+        """ Returns the symmetries of the board that map solutions to solutions, as a list of
+        (name, mapping) tuples, where mapping takes (i, j) to its image. The identity comes first.
+        A reflection of a solution needs every piece turned upside down, which swaps its X's and
+        O's, so reflections are valid only if they swap is_o, and rotations only if they keep it.
+        """
+        h, w = self.max_i, self.max_j
+        # (name, is_reflection, mapping)
+        candidates = [("identity", False, lambda i, j: (i, j)),
+                      ("rotate_180", False, lambda i, j: (h - i, w - j)),
+                      ("mirror_rows", True, lambda i, j: (h - i, j)),
+                      ("mirror_columns", True, lambda i, j: (i, w - j))]
+        if self.width == self.height:
+            candidates += [("rotate_90", False, lambda i, j: (j, w - i)),
+                           ("rotate_270", False, lambda i, j: (h - j, i)),
+                           ("transpose", True, lambda i, j: (j, i)),
+                           ("anti_transpose", True, lambda i, j: (w - j, h - i))]
+        symmetries = []
+        for name, is_reflection, mapping in candidates:
+            if all(self.is_cell(*mapping(i, j)) and
+                   self.is_o(*mapping(i, j)) == (self.is_o(i, j) != is_reflection)
+                   for i, j in self.cells()):
+                symmetries.append((name, mapping))
+        return symmetries
+
+    def canonical_cells(self) -> set:
+        """ Returns the cells that are the smallest (i, j) of their orbit under the board's
+        symmetries. Every solution has at least one symmetric copy with part 0 of the reference
+        piece in one of these cells: more than one if a symmetry fixes that cell (e.g., the
+        center of an odd-sized board under rotate_180), see canonical_placements. """
+        symmetries = self.symmetries()
+        cells = set()
+        for i, j in self.cells():
+            if (i, j) == min(mapping(i, j) for _, mapping in symmetries):
+                cells.add((i, j))
+        return cells
+
+    def canonical_placements(self, piece: Piece) -> set:
+        """ Returns the placements of piece (see placements) that are the smallest of their
+        orbit under the board's symmetries, comparing the (i, j) of the parts in order. Their
+        part 0 is in a canonical cell, and a symmetry that fixes that cell can only map them to
+        a larger placement. If piece is asymmetric (see reference_piece), no symmetry other than
+        the identity maps a placement to itself, so exactly one of each set of symmetric
+        solutions has piece in one of these placements. """
+        symmetries = self.symmetries()
+        return {placement for placement in self.placements(piece)
+                if all(placement <= tuple(mapping(i, j) for i, j in placement)
+                       for _, mapping in symmetries)}
+
+    def reference_piece(self):
+        """ Returns the first asymmetric piece, whose placement identifies a solution among its
+        symmetric copies, or None if all pieces are symmetric. """
+        for piece in self.pieces:
+            if piece.is_asymmetric():
+                return piece
+        return None
+
+    def symmetric_solutions(self, solution) -> list:
+        """ Returns the solutions that are symmetric to solution (not including itself). """
+        ret = []
+        for name, mapping in self.symmetries()[1:]:
+            other = solution.transform(mapping)
+            if other != solution and other not in ret:
+                ret.append(other)
+        return ret
+
+    def is_solution(self, solution) -> bool:
+        """ Returns true if solution is a whole solution of this board: every cell covered, and
+        every piece in one of its placements. """
+        if solution.grid.shape != self.mask.shape or \
+                not np.array_equal(solution.grid != EMPTY, self.mask):
+            return False
+        try:
+            self.solution_placements(solution)
+        except ValueError:
+            return False
+        return True
+
+    def solution_placements(self, solution, partial: bool = False) -> list:
+        """ Returns the placement of each piece in solution, as (k, placement) tuples with the
+        placements given by placements. Raises ValueError if solution is not a solution of this
+        board. If partial, pieces that are not in solution (e.g., in a challenge, with EMPTY
+        cells for the pieces to place) are left out. """
+        ret = []
+        for piece in self.pieces:
+            cells = frozenset(zip(*map(list, np.nonzero(solution.grid == piece.idx))))
+            if partial and len(cells) == 0:
+                continue
+            for placement in self.placements(piece):
+                if frozenset(placement) == cells:
+                    ret.append((piece.idx, placement))
+                    break
+            else:
+                raise ValueError(f"Piece {piece.idx} is not placed on the board.")
+        return ret
 
     def valid_i(self, i: int):
         """ Returns true if i is a valid row index. """
@@ -33,18 +191,39 @@ class Board:
         """ Returns true if k is a valid piece index. """
         return 0 <= k < self.num_pieces
 
-    def compute_valid_rotations(self, i: int, j: int, piece: Piece, all_rotations: list):
-        """ Given a list of all possible piece rotations, returns the rotations
-        that are allowed for coordinate (i, j), i.e., that don't fall off the board. """
-        valid_rotations = []
-        # we want rotations with rotation[0] = (piece.os[0] != is_o(i, j))
-        for flipped, positions in filter(lambda r: r[0] == (piece.os[0] != self.is_o(i, j)),
-                                         all_rotations):
-            min_i = min(map(lambda coord: i + coord[0], positions))
-            max_i = max(map(lambda coord: i + coord[0], positions))
-            min_j = min(map(lambda coord: j + coord[1], positions))
-            max_j = max(map(lambda coord: j + coord[1], positions))
-            if self.valid_i(max_i) and self.valid_i(min_i) and \
-                    self.valid_j(min_j) and self.valid_j(max_j):
-                valid_rotations.append((flipped, positions))
-        return valid_rotations
+    def placements(self, piece: Piece) -> list:
+        """ Returns all the ways piece can be placed on the board, as tuples with the (i, j) of
+        each part. Placements that cover the same cells are kept only once. The list is computed
+        once per piece, and must not be changed. """
+        if piece.idx in self._placements:
+            return self._placements[piece.idx]
+        placements = []
+        seen = set()
+        for orientation in piece.orientations:
+            for i, j in self.anchors(orientation):
+                placement = tuple((i + pos[0], j + pos[1]) for pos in orientation.positions)
+                cells = frozenset(placement)
+                if cells not in seen:
+                    seen.add(cells)
+                    placements.append(placement)
+        self._placements[piece.idx] = placements
+        return placements
+
+    def fits(self, i: int, j: int, orientation: Orientation) -> bool:
+        """ Returns true if a piece in the given orientation can have part #0 in (i, j), i.e.,
+        if all its parts are on cells of the board and its X's and O's agree with the board's. """
+        if not (self.valid_i(i + orientation.min_i) and self.valid_i(i + orientation.max_i) and
+                self.valid_j(j + orientation.min_j) and self.valid_j(j + orientation.max_j)):
+            return False
+        return all(self.mask[i + di, j + dj] and self.parity[i + di, j + dj] == o
+                   for (di, dj), o in zip(orientation.positions, orientation.os))
+
+    def anchors(self, orientation: Orientation) -> list:
+        """ Returns the cells where part #0 of a piece in the given orientation can be (see
+        fits). """
+        return [(i, j) for i, j in self.cells() if self.fits(i, j, orientation)]
+
+    def valid_orientations(self, i: int, j: int, piece: Piece) -> list:
+        """ Returns the orientations of piece that are allowed with part #0 in (i, j) (see
+        fits). """
+        return [o for o in piece.orientations if self.fits(i, j, o)]
@@ -0,0 +1,121 @@
+import time
+from dataclasses import dataclass, field
+
+import numpy as np
+
+from board import Board
+from placement_encoder import PlacementEncoder
+from solution import EMPTY, Solution
+from solvers import make_backend
+
+
+@dataclass
+class ChallengeResult:
+    """ Answer to a challenge: no solution, a unique one, or several (two of them). """
+    solutions: list = field(default_factory=list)
+    calls: int = 0
+    elapsed: float = 0.0
+
+    @property
+    def status(self) -> str:
+        return ["unsolvable", "unique", "multiple"][len(self.solutions)]
+
+    @property
+    def unique(self) -> bool:
+        return len(self.solutions) == 1
+
+    def __str__(self):
+        return f"{self.status} ({self.calls} solver calls, {self.elapsed:.3f}s)"
+
+
+class ChallengeSolver:
+    """ Solves challenges, i.e., partial solutions with some pieces already placed (and EMPTY
+    cells for the others), on one board. The board is encoded once, and the same warm solver
+    answers all challenges: the placed pieces are assumptions, so nothing is added for good.
+    Checking uniqueness blocks the first solution under an activation variable, so that each
+    challenge takes at most two calls. Symmetries are not broken: placed pieces break them. """
+
+    def __init__(self, board: Board, encoder_class=PlacementEncoder, backend: str = 'pysat',
+                 solver: str = None, encoder_options: dict = None):
+        self.board = board
+        options = dict(encoder_options or {}, symmetry_breaking=False)
+        self.encoder = encoder_class(board, **options)
+        self.encoder.encode()
+        self.backend = make_backend(backend, self.encoder, solver)
+
+    def assumptions(self, partial: Solution) -> list:
+        """ The p variables that place the pieces of partial. """
+        return [var for k, placement in self.board.solution_placements(partial, partial=True)
+                for var in self.encoder.placement_vars(k, placement)]
+
+    def solve(self, partial: Solution, check_unique: bool = True) -> ChallengeResult:
+        """ Returns a solution of the challenge and, if check_unique, another one if there
+        is. """
+        start_time = time.time()
+        ret = ChallengeResult()
+        assumptions = self.assumptions(partial)
+        result, model = self.backend.solve(assumptions)
+        ret.calls += 1
+        if result is None:
+            raise RuntimeError(f"The solver '{self.backend.name}' gave no answer.")
+        if result == 1:
+            ret.solutions.append(self.encoder.get_solution(model))
+            if check_unique:
+                activation = self.encoder.new_var("challenge")
+                self.encoder.block_model(model, activation)
+                result, model = self.backend.solve(assumptions + [activation])
+                ret.calls += 1
+                # retire the blocking clause for good.
+                self.encoder.add_constraint([-activation])
+                if result is None:
+                    raise RuntimeError(f"The solver '{self.backend.name}' gave no answer.")
+                if result == 1:
+                    ret.solutions.append(self.encoder.get_solution(model))
+        ret.elapsed = time.time() - start_time
+        return ret
+
+    def close(self):
+        self.backend.close()
+
+
+def board_grid(board: Board, partial: Solution) -> np.ndarray:
+    """ The colors of partial, cut or padded (with EMPTY) to the size of board. """
+    grid = np.full((board.height, board.width), EMPTY, dtype=np.uint8)
+    height, width = min(board.height, partial.height), min(board.width, partial.width)
+    grid[:height, :width] = partial.grid[:height, :width]
+    return grid
+
+
+def prune(board: Board, partial: Solution) -> tuple:
+    """ Returns the board left by a challenge: without the cells and pieces of partial. The
+    pieces of the returned board keep their order; ids maps each of them to its index in
+    board. Returns (board, ids). Encoding this board leaves out all the variables fixed by
+    the placed pieces, and the ones they rule out. """
+    placed = {k for k, _ in board.solution_placements(partial, partial=True)}
+    ids = [k for k in range(board.num_pieces) if k not in placed]
+    mask = board.mask & (board_grid(board, partial) == EMPTY)
+    return Board(board.width, board.height, [board.piece_ids[k] for k in ids], mask,
+                 board.parity, board.piece_set), ids
+
+
+def solve_pruned(board: Board, partial: Solution, encoder_class=PlacementEncoder,
+                 backend: str = 'pysat', solver: str = None, encoder_options: dict = None,
+                 check_unique: bool = True) -> ChallengeResult:
+    """ Like ChallengeSolver.solve, but encodes only what is left of the board (see prune),
+    which gives a much smaller formula for a single challenge. """
+    start_time = time.time()
+    sub_board, ids = prune(board, partial)
+    solver = ChallengeSolver(sub_board, encoder_class, backend, solver, encoder_options)
+    try:
+        ret = solver.solve(Solution.from_grid(np.full((board.height, board.width), EMPTY)),
+                           check_unique)
+    finally:
+        solver.close()
+    # back to the colors of board, with the placed pieces.
+    for n, sub_solution in enumerate(ret.solutions):
+        grid = board_grid(board, partial)
+        for sub_k, k in enumerate(ids):
+            grid[sub_solution.grid == sub_k] = k
+        ret.solutions[n] = Solution.from_grid(grid, board.parity)
+    ret.elapsed = time.time() - start_time
+    return ret
@@ -0,0 +1,71 @@
+import glob
+import os
+
+from solution import Solution
+
+
+def read_solutions(directory: str) -> list:
+    """ Returns the solutions stored in directory by main.py -t, in order. Files that cannot be
+    read (e.g., cut short by a crash) are left out. """
+    ret = []
+    for filename in sorted(glob.glob(os.path.join(directory, '*.out'))):
+        solution = Solution()
+        try:
+            solution.read(filename)
+        except ValueError:
+            continue
+        ret.append(solution)
+    return ret
+
+
+class CheckpointLog:
+    """ Append-only log of the solutions found by an enumeration, one per line (the rows of the
+    solution, separated by spaces), so that it can be resumed after a crash. Each line is flushed
+    to disk as soon as it is written; a line cut by a crash is ignored when reading, and so is,
+    with a warning, any other line that is not a solution (e.g., edited by hand). """
+
+    def __init__(self, filename: str):
+        self.filename = filename
+        self.f = None
+
+    def read(self) -> list:
+        """ Returns the solutions in the log, or an empty list if there is no log yet. """
+        ret = []
+        if not os.path.exists(self.filename):
+            return ret
+        with open(self.filename) as f:
+            lines = f.readlines()
+        for n, line in enumerate(lines, 1):
+            if not line.endswith('\n'):
+                break
+            solution = Solution()
+            try:
+                solution.read_rows(line.split())
+            except ValueError as e:
+                print(f"# {self.filename}:{n}: not a solution, ignored ({e})")
+                continue
+            ret.append(solution)
+        return ret
+
+    def append(self, solution: Solution):
+        if self.f is None:
+            self.truncate_torn_line()
+            self.f = open(self.filename, 'a')
+        self.f.write(' '.join(repr(solution).split('\n')) + '\n')
+        self.f.flush()
+        os.fsync(self.f.fileno())
+
+    def truncate_torn_line(self):
+        """ Remove the end of a line cut by a crash, so that new lines are appended after the
+        last complete one. """
+        if not os.path.exists(self.filename):
+            return
+        with open(self.filename, 'rb+') as f:
+            data = f.read()
+            if len(data) > 0 and not data.endswith(b'\n'):
+                f.truncate(data.rfind(b'\n') + 1)
+
+    def close(self):
+        if self.f is not None:
+            self.f.close()
+            self.f = None
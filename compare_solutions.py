@@ -1,34 +1,97 @@
+import argparse
 import glob
 
 import numpy as np
 from matplotlib import pyplot as plt
 
 from solution import Solution
+from solution_store import SolutionStore
 
 solutions_dir = "solutions/"
 
+# bytes of cell comparisons per block of rows of the distance matrix.
+max_block_bytes = 64 * 1024 * 1024
+
+
+def stack(solutions: list) -> np.ndarray:
+    """ All solutions in one (N, cells) array. """
+    return np.stack([solution.grid.ravel() for solution in solutions])
+
+
+def distance_matrix(grids: np.ndarray, block_size: int = None) -> np.ndarray:
+    """ Hamming distances between all pairs of rows of grids, computed by broadcasting a block
+    of rows at a time against all of them, so that memory stays bounded. """
+    n, cells = grids.shape
+    if block_size is None:
+        block_size = max(1, max_block_bytes // max(1, n * cells))
+    dist = np.empty((n, n), dtype=np.int32)
+    for start in range(0, n, block_size):
+        block = grids[start:start + block_size]
+        dist[start:start + len(block)] = \
+            np.count_nonzero(block[:, None, :] != grids[None, :, :], axis=2)
+    return dist
+
+
+def nearest_neighbour_order(dist: np.ndarray, first: int = 0) -> list:
+    """ Orders the solutions greedily: each one is followed by the closest one not taken yet. """
+    n = len(dist)
+    taken = np.zeros(n, dtype=bool)
+    order = [first]
+    taken[first] = True
+    for _ in range(n - 1):
+        row = np.where(taken, np.iinfo(dist.dtype).max, dist[order[-1]])
+        last = int(np.argmin(row))
+        order.append(last)
+        taken[last] = True
+    return order
+
+
+def read_cmd_args():
+    argparser = argparse.ArgumentParser(
+        description='Compare the stored solutions and show them, each next to the closest one.')
+    argparser.add_argument('--headless', action='store_true',
+                           help='Write the distance matrix and the order to files instead of '
+                                'showing them.')
+    argparser.add_argument('-o', '--output', default='comparison',
+                           help='With --headless, write OUTPUT_distances.npy, '
+                                'OUTPUT_distances.png and OUTPUT_order.txt.')
+    argparser.add_argument('--store', metavar='FILE',
+                           help=f'Read the solutions from a solution store instead of '
+                                f'{solutions_dir}*.out.')
+    argparser.add_argument('--block-size', type=int,
+                           help='Rows of the distance matrix computed at a time.')
+    return argparser.parse_args()
+
+
 if __name__ == '__main__':
-    files = glob.glob(solutions_dir + '*.out')
-    solutions = []
-    for file in files:
-        sol = Solution()
-        sol.read(file)
-        solutions.append(sol)
-
-    data = []
-    plt.figure()
-    for i in solutions:
-        data_r = []
-        for j in solutions:
-            data_r.append(i.distance_to(j))
-        data.append(data_r)
-    plt.imshow(data, cmap="Blues")
-    plt.show()
-
-    last = solutions.pop(0)
-    while len(solutions) > 0:
-        # print(list(map(lambda sol: last.distance_to(sol), solutions)))
-        closest_idx = np.argmin(list(map(lambda sol: last.distance_to(sol), solutions)))
-        last.show()
-        last = solutions.pop(int(closest_idx))
-    last.show()
+    args = read_cmd_args()
+    if args.store is not None:
+        store = SolutionStore(args.store)
+        grids = store.grids().reshape(len(store), -1)
+        files = [f'{args.store}[{idx}]' for idx in range(len(store))]
+        solutions = store
+    else:
+        files = sorted(glob.glob(solutions_dir + '*.out'))
+        solutions = []
+        for file in files:
+            sol = Solution()
+            sol.read(file)
+            solutions.append(sol)
+        grids = stack(solutions)
+
+    data = distance_matrix(grids, args.block_size)
+    order = nearest_neighbour_order(data)
+
+    if args.headless:
+        np.save(args.output + '_distances.npy', data)
+        plt.imsave(args.output + '_distances.png', data, cmap="Blues")
+        with open(args.output + '_order.txt', 'w') as f:
+            for idx in order:
+                f.write(files[idx] + '\n')
+    else:
+        plt.figure()
+        plt.imshow(data, cmap="Blues")
+        plt.show()
+
+        for idx in order:
+            solutions[idx].show()
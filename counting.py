@@ -0,0 +1,106 @@
+import time
+from dataclasses import dataclass, field
+
+from board import Board
+
+
+def cell_order(board: Board) -> list:
+    """ The cells of board column by column if it is wider than tall, else row by row, i.e., by
+    lines along the short side. The states of SolutionCounter differ only by the cells covered
+    after the first free one, and these are within as many lines of it as a piece can span (5
+    for the straight piece): short lines keep the number of states small. """
+    if board.width > board.height:
+        return sorted(board.cells(), key=lambda cell: (cell[1], cell[0]))
+    return board.cells()
+
+
+class SolutionCounter:
+    """ Counts the exact covers of a board without enumerating them. Cells are numbered in
+    cell_order, and sets of cells and of pieces are bit masks. Each step covers the first free
+    cell, so the cells before it are all covered and the state is just (covered cells, used
+    pieces): the number of ways to complete each state is memoised, and states reached by many
+    partial solutions are only counted once.
+    With a mapping (a board symmetry, see Board.symmetries), only the placements that the
+    mapping leaves in place are used, which counts the solutions that the mapping fixes. """
+
+    def __init__(self, board: Board, mapping=None):
+        self.board = board
+        self.mapping = mapping
+        cells = cell_order(board)
+        bit = {cell: n for n, cell in enumerate(cells)}
+        # (k, piece bit, cells bit mask, placement) of the placements, by their first cell.
+        self.placements = [[] for _ in cells]
+        for piece in board.pieces:
+            for placement in board.placements(piece):
+                if not self.allows(piece.idx, placement):
+                    continue
+                mask = sum(1 << bit[cell] for cell in placement)
+                first = (mask & -mask).bit_length() - 1
+                self.placements[first].append((piece.idx, 1 << piece.idx, mask, placement))
+        self.all_cells = (1 << len(cells)) - 1
+        self.all_pieces = (1 << board.num_pieces) - 1
+        self.memo = {}
+
+    def allows(self, k: int, placement: tuple) -> bool:
+        """ Returns true if the placement of piece k is used: with a mapping, if the mapping
+        leaves it in place. """
+        return self.mapping is None or \
+            {self.mapping(i, j) for i, j in placement} == set(placement)
+
+    @staticmethod
+    def first_free(covered: int) -> int:
+        """ The first cell that is not in covered. """
+        return ((covered + 1) & ~covered).bit_length() - 1
+
+    def lookup(self, key: tuple):
+        """ The memoised count of the state key, or None. """
+        return self.memo.get(key)
+
+    def store(self, key: tuple, count: int):
+        """ Memoises the count of the state key. """
+        self.memo[key] = count
+
+    def count(self, covered: int = 0, used: int = 0) -> int:
+        """ Number of ways to complete the state (covered, used) into a solution. """
+        if covered == self.all_cells:
+            return 1 if used == self.all_pieces else 0
+        key = (covered, used)
+        ret = self.lookup(key)
+        if ret is None:
+            ret = 0
+            for _, piece_bit, mask, _ in self.placements[self.first_free(covered)]:
+                if piece_bit & used == 0 and mask & covered == 0:
+                    ret += self.count(covered | mask, used | piece_bit)
+            self.store(key, ret)
+        return ret
+
+
+@dataclass
+class CountResult:
+    """ Number of solutions of a board, and of solutions up to symmetry (orbits), which is the
+    average number of solutions fixed by each symmetry (Burnside's lemma). """
+    solutions: int
+    orbits: int
+    fixed: dict = field(default_factory=dict)  # symmetry name -> solutions it fixes.
+    states: int = 0
+    elapsed: float = 0.0
+
+    def __str__(self):
+        fixed = ', '.join(f"{name} {count}" for name, count in self.fixed.items())
+        return f"{self.solutions} solutions, {self.orbits} up to symmetry (fixed by {fixed}); " \
+               f"{self.states} states in {self.elapsed:.3f}s"
+
+
+def count_solutions(board: Board) -> CountResult:
+    """ Counts the solutions of board, with and without symmetries. """
+    start_time = time.time()
+    fixed = {}
+    states = 0
+    for name, mapping in board.symmetries():
+        counter = SolutionCounter(board, None if name == "identity" else mapping)
+        fixed[name] = counter.count()
+        states += len(counter.memo)
+    num_symmetries = len(fixed)
+    assert sum(fixed.values()) % num_symmetries == 0
+    return CountResult(fixed["identity"], sum(fixed.values()) // num_symmetries, fixed, states,
+                       time.time() - start_time)
@@ -0,0 +1,172 @@
+from typing import Iterator, Optional
+
+from board import Board
+from solution import Solution
+
+
+class DancingLinks:
+    """ Knuth's Algorithm X with dancing links, for exact cover problems.
+    Nodes are indexes in flat lists: node 0 is the root, nodes 1..num_columns are the column
+    headers, and the remaining nodes are the 1's of the rows. nodes counts the rows tried by
+    search, i.e., the size of the search tree. """
+
+    def __init__(self, num_columns: int, rows: list):
+        self.nodes = 0
+        n = num_columns + 1
+        self.left = [n - 1] + list(range(n - 1))
+        self.right = list(range(1, n)) + [0]
+        self.up = list(range(n))
+        self.down = list(range(n))
+        self.column = list(range(n))
+        self.row = [-1] * n
+        self.size = [0] * n
+        for r, columns in enumerate(rows):
+            self.add_row(r, columns)
+
+    def add_row(self, r: int, columns: list):
+        """ Add row r, with 1's in the given columns (numbered from 0). """
+        first = None
+        for col in columns:
+            c = col + 1
+            x = len(self.column)
+            self.column.append(c)
+            self.row.append(r)
+            self.up.append(self.up[c])
+            self.down.append(c)
+            self.down[self.up[c]] = x
+            self.up[c] = x
+            self.size[c] += 1
+            if first is None:
+                first = x
+                self.left.append(x)
+                self.right.append(x)
+            else:
+                self.left.append(self.left[first])
+                self.right.append(first)
+                self.right[self.left[first]] = x
+                self.left[first] = x
+
+    def cover(self, c: int):
+        left, right, up, down, column, size = \
+            self.left, self.right, self.up, self.down, self.column, self.size
+        right[left[c]] = right[c]
+        left[right[c]] = left[c]
+        i = down[c]
+        while i != c:
+            j = right[i]
+            while j != i:
+                down[up[j]] = down[j]
+                up[down[j]] = up[j]
+                size[column[j]] -= 1
+                j = right[j]
+            i = down[i]
+
+    def uncover(self, c: int):
+        left, right, up, down, column, size = \
+            self.left, self.right, self.up, self.down, self.column, self.size
+        i = up[c]
+        while i != c:
+            j = left[i]
+            while j != i:
+                size[column[j]] += 1
+                down[up[j]] = j
+                up[down[j]] = j
+                j = left[j]
+            i = up[i]
+        right[left[c]] = c
+        left[right[c]] = c
+
+    def cover_columns(self, columns: list):
+        """ Cover the given columns (numbered from 0), e.g., those of rows that are part of every
+        exact cover wanted, before a search. """
+        for col in columns:
+            self.cover(col + 1)
+
+    def uncover_columns(self, columns: list):
+        """ Undo cover_columns(columns). """
+        for col in reversed(columns):
+            self.uncover(col + 1)
+
+    def search(self, partial: list = None) -> Iterator[list]:
+        """ Yields every exact cover, as a list of row numbers. """
+        if partial is None:
+            partial = []
+        right, down, size = self.right, self.down, self.size
+        if right[0] == 0:
+            yield list(partial)
+            return
+        # choose the column with the fewest 1's
+        c = right[0]
+        best = c
+        while c != 0:
+            if size[c] < size[best]:
+                best = c
+            c = right[c]
+        c = best
+        self.cover(c)
+        r = down[c]
+        while r != c:
+            self.nodes += 1
+            partial.append(self.row[r])
+            j = right[r]
+            while j != r:
+                self.cover(self.column[j])
+                j = right[j]
+            yield from self.search(partial)
+            j = self.left[r]
+            while j != r:
+                self.uncover(self.column[j])
+                j = self.left[j]
+            partial.pop()
+            r = down[r]
+        self.uncover(c)
+
+
+def exact_cover(board: Board, symmetry_breaking: bool = False, fixed: tuple = None) -> tuple:
+    """ Returns the exact cover problem of board, as a DancingLinks and the (k, placement) of
+    each of its rows. There is one column per cell and one per piece, and one row per placement
+    of a piece (see Board.placements). With symmetry_breaking, the reference piece only has
+    its canonical placements, as in Encoder.encode_symmetry_breaking. If fixed is a
+    (k, placement) tuple, piece k can only be in that placement. """
+    placements = []
+    rows = []
+    reference = board.reference_piece() if symmetry_breaking else None
+    canonical = board.canonical_placements(reference) if reference is not None else None
+    for piece in board.pieces:
+        for placement in board.placements(piece):
+            if reference is not None and piece.idx == reference.idx and \
+                    placement not in canonical:
+                continue
+            if fixed is not None and piece.idx == fixed[0] and \
+                    frozenset(placement) != frozenset(map(tuple, fixed[1])):
+                continue
+            placements.append((piece.idx, placement))
+            rows.append([int(board.cell_index[i, j]) for i, j in placement] +
+                        [board.num_cells + piece.idx])
+
+    return DancingLinks(board.num_cells + board.num_pieces, rows), placements
+
+
+def solutions(board: Board, num_max_solutions: Optional[int] = None,
+              symmetry_breaking: bool = False, fixed: tuple = None,
+              blocked: list = None) -> Iterator[Solution]:
+    """ Yields the solutions of board, up to num_max_solutions of them, as Solution objects
+    (see exact_cover). With symmetry_breaking, only one of each set of symmetric solutions is
+    yielded. The solutions in blocked (e.g., found by a previous run) are not yielded nor
+    counted in num_max_solutions, but the search goes through them again: dancing links
+    cannot tell where they are before reaching them. """
+    blocked = set(blocked or [])
+    dlx, placements = exact_cover(board, symmetry_breaking, fixed)
+    num_solutions = 0
+    for cover in dlx.search():
+        if num_max_solutions is not None and num_solutions >= num_max_solutions:
+            return
+        solution = Solution(board.height, board.width, board.parity)
+        for r in cover:
+            k, placement = placements[r]
+            for i, j in placement:
+                solution.add_color(i, j, k)
+        if solution in blocked:
+            continue
+        num_solutions += 1
+        yield solution
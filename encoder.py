@@ -1,56 +1,113 @@
-import re
+import io
+import math
 from itertools import combinations
 
+import numpy as np
+
 from board import Board
 from piece import Piece
-from solution import Solution
+from solution import EMPTY, Solution
 
 
-def neg(lit: str): return lit[1:] if lit[0] == '-' else '-' + lit
+def neg(lit: int): return -lit
 
 
-class Encoder:
-    """ I don't need 'o' variables. """
+# at-most-one encodings, by name, and the Encoder method that implements each of them.
+amo_encodings = {"pairwise": "add_sum_le1_pw", "sequential": "add_sum_le1_sc",
+                 "ladder": "add_sum_le1_ladder", "commander": "add_sum_le1_commander",
+                 "product": "add_sum_le1_product"}
+
 
-    def __init__(self, board: Board):
-        self._vars = {}
+class Encoder:
+    """ I don't need 'o' variables.
+    Variables are plain DIMACS ids: p variables are numbered densely and arithmetically from
+    (i, j, k, l), only for the cells that exist (see Board.cells), auxiliary variables are
+    allocated after them. """
+
+    def __init__(self, board: Board, symmetry_breaking: bool = False, cell_amo: str = "pairwise",
+                 part_amo: str = "pairwise"):
+        self.num_vars = 0
         self.constraints = []
-        self.s_fresh = -1  # counter for sequential counter's aux s variables.
+        self._aux_names = {}  # debug names for auxiliary variables.
+        self.s_fresh = -1  # counter for the aux variables of at-most-one encodings.
         self.board = board
+        self.symmetry_breaking = symmetry_breaking
+        # at-most-one encodings for "one piece per cell" and for "one cell per part" constraints.
+        self.cell_amo = cell_amo
+        self.part_amo = part_amo
+
+        # part_offset[k] + l is the index of part l of piece k among all parts of all pieces;
+        # parts[idx] is the inverse mapping.
+        self.part_offset = []
+        self.parts = []
+        for k in range(self.board.num_pieces):
+            self.part_offset.append(len(self.parts))
+            self.parts.extend((k, l) for l in range(self.board.pieces[k].num_parts))
+        self.num_parts = len(self.parts)
+        self.num_p_vars = 0
+        self._part_index = None  # see part_index.
+        self._last_decoded = (None, None)  # (model, parts) of the last call to decode_model.
 
         self.init_vars()
 
-    def p(self, i: int, j: int, k: int, l: int):
-        assert self.board.valid_i(i), f"i: {i}"
-        assert self.board.valid_j(j), f"j: {j}"
+    def p(self, i: int, j: int, k: int, l: int) -> int:
+        assert self.board.is_cell(i, j), f"(i, j): {(i, j)}"
         assert self.board.valid_k(k), f"k: {k}"
-        assert 0 <= l <= self.board.pieces[k].num_parts, f"l: {l}"
+        assert 0 <= l < self.board.pieces[k].num_parts, f"l: {l}"
+
+        return int(self.board.cell_index[i, j]) * self.num_parts + self.part_offset[k] + l + 1
+
+    def is_p(self, var: int) -> bool:
+        return 0 < var <= self.num_p_vars
+
+    def de_p(self, var: int):
+        """ Inverse of p: returns (i, j, k, l) for a p variable id. """
+        cell, part = divmod(var - 1, self.num_parts)
+        i, j = self.board.cells()[cell]
+        k, l = self.parts[part]
+        return i, j, k, l
+
+    def decode_var(self, var: int) -> list:
+        """ Returns the (i, j, k, l) parts placed on the board by a true p variable. """
+        return [self.de_p(var)]
+
+    def part_vars(self, i: int, j: int, k: int, l: int) -> list:
+        """ Returns the p variables that place part l of piece k in (i, j). """
+        return [self.p(i, j, k, l)]
 
-        return f"p_{str(i).rjust(len(str(self.board.max_i)), '0')}_" \
-               f"{str(j).rjust(len(str(self.board.max_j)), '0')}_" \
-               f"{str(k).rjust(len(str(self.board.num_pieces - 1)), '0')}_" \
-               f"{str(l).rjust(len(str(self.board.pieces[k].num_parts - 1)), '0')}"
+    def placement_vars(self, k: int, placement) -> list:
+        """ Returns the p variables that, all true, place piece k with part l in placement[l]. """
+        return [self.p(i, j, k, l) for l, (i, j) in enumerate(placement)]
 
-    @staticmethod
-    def de_p(p_name: str):
-        rgx = r"p_(\d+)_(\d+)_(\d+)_(\d+)"
-        return map(int, re.match(rgx, p_name).groups())
+    def var_name(self, var: int) -> str:
+        """ Human-readable name of a variable, for debugging only. """
+        if self.is_p(var):
+            i, j, k, l = self.de_p(var)
+            return f"p_{str(i).rjust(len(str(self.board.max_i)), '0')}_" \
+                   f"{str(j).rjust(len(str(self.board.max_j)), '0')}_" \
+                   f"{str(k).rjust(len(str(self.board.num_pieces - 1)), '0')}_" \
+                   f"{str(l).rjust(len(str(self.board.pieces[k].num_parts - 1)), '0')}"
+        return self._aux_names.get(var, f"x_{var}")
+
+    def lit_name(self, lit: int) -> str:
+        return ('-' if lit < 0 else '') + self.var_name(abs(lit))
 
     # aux var for sequential counter encoding for <= 1 constraints
     def s(self, i):
         """ variable used for sequential counter encoding """
-        return f's_{i}_{self.s_fresh}'
+        return self.new_var(f's_{i}_{self.s_fresh}')
 
     def init_vars(self):
         # p vars
-        for i in range(self.board.height):
-            for j in range(self.board.width):
-                for k in range(self.board.num_pieces):
-                    for l in range(self.board.pieces[k].num_parts):
-                        self.add_var(self.p(i, j, k, l))
+        self.num_p_vars = self.board.num_cells * self.num_parts
+        self.num_vars = self.num_p_vars
 
-    def add_var(self, var: str):
-        self._vars[var] = len(self._vars) + 1
+    def new_var(self, name: str = None) -> int:
+        """ Allocates a fresh auxiliary variable. """
+        self.num_vars += 1
+        if name is not None:
+            self._aux_names[self.num_vars] = name
+        return self.num_vars
 
     def add_constraint(self, constraint):
         """add constraints, which is a list of literals"""
@@ -58,15 +115,21 @@ class Encoder:
         assert (isinstance(constraint, list))
         self.constraints.append(constraint)
 
-    def add_sum_eq1(self, sum_lits):
+    def add_sum_eq1(self, sum_lits, amo: str = "pairwise"):
         """
-        encodes clauses SUM(sum_lits) = 1.
+        encodes clauses SUM(sum_lits) = 1, using the at-most-one encoding amo.
         """
-        self.add_sum_le1(sum_lits)
-        # self.add_sum_le1_sc(sum_lits)
+        self.add_sum_le1(sum_lits, amo)
         self.add_sum_ge1(sum_lits)
 
-    def add_sum_le1(self, sum_lits):
+    def add_sum_le1(self, sum_lits, amo: str = "pairwise"):
+        """
+        encodes clauses SUM(sum_lits) <= 1, using the at-most-one encoding amo (one of the
+        keys of amo_encodings).
+        """
+        getattr(self, amo_encodings[amo])(sum_lits)
+
+    def add_sum_le1_pw(self, sum_lits):
         """
         encodes clauses SUM(sum_lits) <= 1 using pairwise encoding.
         """
@@ -89,17 +152,83 @@ class Encoder:
 
         self.s_fresh += 1
         n = len(sum_lits) - 1
+        s = [self.s(i) for i in range(n)]
 
-        self.add_constraint([neg(sum_lits[0]), self.s(0)])
-        self.add_constraint([neg(sum_lits[n]), neg(self.s(n - 1))])
+        self.add_constraint([neg(sum_lits[0]), s[0]])
+        self.add_constraint([neg(sum_lits[n]), neg(s[n - 1])])
 
         for i in range(1, n):
             # s(i) is true if x_1 is true
-            self.add_constraint([neg(sum_lits[i]), self.s(i)])
+            self.add_constraint([neg(sum_lits[i]), s[i]])
             # s(i) is true if s(i-1) is true
-            self.add_constraint([neg(self.s(i - 1)), self.s(i)])
+            self.add_constraint([neg(s[i - 1]), s[i]])
             # x_i can only be set to true is s(i-1) is false
-            self.add_constraint([neg(sum_lits[i]), neg(self.s(i - 1))])
+            self.add_constraint([neg(sum_lits[i]), neg(s[i - 1])])
+        return s
+
+    def add_sum_le1_ladder(self, sum_lits):
+        """
+        encodes clauses SUM(sum_lits) <= 1 using the ladder encoding: the sequential counter,
+        plus clauses that make s(i) true only if some x_j, j <= i, is true.
+        """
+        # Gent & Nightingale 2004: x_i <-> s(i) /\ -s(i-1)
+        s = self.add_sum_le1_sc(sum_lits)
+        if s is None:
+            return
+
+        self.add_constraint([neg(s[0]), sum_lits[0]])
+        for i in range(1, len(s)):
+            # s(i) is true only if s(i-1) or x_i is true
+            self.add_constraint([neg(s[i]), s[i - 1], sum_lits[i]])
+
+    def add_sum_le1_commander(self, sum_lits, group_size: int = 3):
+        """
+        encodes clauses SUM(sum_lits) <= 1 using the commander encoding: lits are split in
+        groups with at most one true lit each, and at most one group's commander is true.
+        """
+        # Klieber & Kwon 2007, applied recursively to the commanders.
+        if len(sum_lits) <= group_size + 1:
+            self.add_sum_le1_pw(sum_lits)
+            return
+
+        self.s_fresh += 1
+        commanders = []
+        for g, start in enumerate(range(0, len(sum_lits), group_size)):
+            group = sum_lits[start:start + group_size]
+            if len(group) == 1:
+                commanders.append(group[0])
+                continue
+            c = self.new_var(f'c_{g}_{self.s_fresh}')
+            self.add_sum_le1_pw(group)
+            for lit in group:
+                # a true lit sets its group's commander
+                self.add_constraint([neg(lit), c])
+            # the commander is true only if some lit in its group is true
+            self.add_constraint([neg(c)] + group)
+            commanders.append(c)
+        self.add_sum_le1_commander(commanders, group_size)
+
+    def add_sum_le1_product(self, sum_lits):
+        """
+        encodes clauses SUM(sum_lits) <= 1 using the product encoding: lits are laid out in a
+        grid, and at most one row and at most one column may contain a true lit.
+        """
+        # Chen 2010, applied recursively to the rows and columns.
+        if len(sum_lits) <= 4:
+            self.add_sum_le1_pw(sum_lits)
+            return
+
+        self.s_fresh += 1
+        num_cols = math.ceil(math.sqrt(len(sum_lits)))
+        num_rows = math.ceil(len(sum_lits) / num_cols)
+        rows = [self.new_var(f'u_{r}_{self.s_fresh}') for r in range(num_rows)]
+        cols = [self.new_var(f'v_{c}_{self.s_fresh}') for c in range(num_cols)]
+        for idx, lit in enumerate(sum_lits):
+            r, c = divmod(idx, num_cols)
+            self.add_constraint([neg(lit), rows[r]])
+            self.add_constraint([neg(lit), cols[c]])
+        self.add_sum_le1_product(rows)
+        self.add_sum_le1_product(cols)
 
     def add_sum_ge1(self, sum_lits):
         """
@@ -111,120 +240,188 @@ class Encoder:
         self.encode_board_constraints()
         for piece in self.board.pieces:
             self.encode_piece_constraints(piece)
-
-    def make_dimacs(self):
-        """ Encode constraints as CNF in DIMACS. """
-        s = ''
-        s += "c Pedro's XOXO\n"
-        s += f"p cnf {len(self._vars)} {len(self.constraints)}\n"
-        for ctr in self.constraints:
-            assert all([var in self._vars or neg(var) in self._vars for var in ctr])
-            s += " ".join(map(str, [self._vars[var] if var in self._vars else -self._vars[neg(var)]
-                                    for var in ctr]))
-            s += ' 0\n'
-        # assert len(s.split('\n')) == len(self.constraints) + 1
-        with open("ex.cnf", 'w') as f:
-            f.write(s)
-        return s
+        if self.symmetry_breaking:
+            self.encode_symmetry_breaking()
+
+    def options(self) -> dict:
+        """ Options that change the encoded formula (besides the board). """
+        return {"symmetry_breaking": self.symmetry_breaking, "cell_amo": self.cell_amo,
+                "part_amo": self.part_amo}
+
+    def aux_names(self) -> dict:
+        """ Debug names of the auxiliary variables, by variable. """
+        return dict(self._aux_names)
+
+    def load_formula(self, constraints: list, num_vars: int, aux_names: dict):
+        """ Use a formula encoded before (see formula_cache) instead of calling encode. """
+        assert num_vars >= self.num_p_vars
+        self.constraints = constraints
+        self.num_vars = num_vars
+        self._aux_names = dict(aux_names)
+
+    def write_dimacs(self, f, chunk_size: int = 4096, extra: list = None):
+        """ Stream constraints as CNF in DIMACS to text file object f (an open file, a solver's
+        stdin, ...), chunk_size clauses per write. Clauses in extra (e.g., unit assumptions)
+        are written after the constraints. """
+        extra = list(extra) if extra else []
+        f.write("c Pedro's XOXO\n")
+        f.write(f"p cnf {self.num_vars} {len(self.constraints) + len(extra)}\n")
+        for clauses in (self.constraints, extra):
+            for start in range(0, len(clauses), chunk_size):
+                chunk = clauses[start:start + chunk_size]
+                f.write(''.join([' '.join(map(str, ctr)) + ' 0\n' for ctr in chunk]))
+
+    def make_dimacs(self, filename: str = None):
+        """ Encode constraints as CNF in DIMACS. If filename is given, the CNF is also
+        written to that file. """
+        if filename is not None:
+            with open(filename, 'w') as f:
+                self.write_dimacs(f)
+        s = io.StringIO()
+        self.write_dimacs(s)
+        return s.getvalue()
 
     def print_constraints(self):
         for ctr in self.constraints:
-            print(f"{{{', '.join(ctr)}}}")
-
-    def print_model(self, model: dict):
-        reversed_vars = {value: key for (key, value) in self._vars.items()}
-        for var_id in model:
-            assert var_id in reversed_vars.keys(), f"{var_id}"
-            if reversed_vars[var_id].startswith("p") and model[var_id]:
-                i, j, k, l = self.de_p(reversed_vars[var_id])
-                print("p", i, j, k, l)
-
-    def block_model(self, model: dict):
-        reversed_vars = {value: key for (key, value) in self._vars.items()}
+            print(f"{{{', '.join(map(self.lit_name, ctr))}}}")
+
+    def part_index(self) -> tuple:
+        """ Inverse index of the p variables, built once with decode_var (and again only if the
+        p variables change): the parts placed by var are rows starts[var - 1]:starts[var] of the
+        (n, 4) array parts, with (i, j, k, l) in each row. Returns (starts, parts). """
+        if self._part_index is None or len(self._part_index[0]) != self.num_p_vars + 1:
+            starts = [0]
+            parts = []
+            for var in range(1, self.num_p_vars + 1):
+                parts.extend(self.decode_var(var))
+                starts.append(len(parts))
+            self._part_index = (np.array(starts, dtype=np.int64),
+                                np.array(parts, dtype=np.int64).reshape(-1, 4))
+        return self._part_index
+
+    def decode_model(self, model) -> np.ndarray:
+        """ Returns the (i, j, k, l) of every part placed by a model (the array of the p
+        variables that are true, see solvers.true_vars), as the rows of an array. The result for
+        the last model is kept, as each model is usually decoded by several consumers. """
+        last_model, last_parts = self._last_decoded
+        if last_model is model:
+            return last_parts
+        assert np.all((model > 0) & (model <= self.num_p_vars)), "not a model of p variables"
+        starts, parts = self.part_index()
+        first, sizes = starts[model - 1], starts[model] - starts[model - 1]
+        # rows first[n], first[n] + 1, ..., first[n] + sizes[n] - 1 of each var n of the model.
+        rows = np.repeat(first - np.cumsum(sizes) + sizes, sizes) + np.arange(sizes.sum())
+        decoded = parts[rows]
+        self._last_decoded = (model, decoded)
+        return decoded
+
+    def print_model(self, model):
+        for i, j, k, l in self.decode_model(model).tolist():
+            print("p", i, j, k, l)
+
+    def model_size(self) -> int:
+        """ Number of true p variables in a model: one part per cell. """
+        return self.board.num_cells
+
+    def block_model(self, model, activation: int = None):
+        """ Block a model. With an activation variable, the model is only blocked in the calls
+        to the solver that assume it. The model is not decoded: in pipelined mode, this runs on
+        the solver's thread. """
+        assert len(model) == self.model_size()
+        ctr = [neg(var) for var in model.tolist()]
+        if activation is not None:
+            ctr.append(neg(activation))
+        self.add_constraint(ctr)
+
+    def block_solution(self, solution: Solution):
+        """ Block a solution found before, e.g., in a previous run. """
         ctr = []
-        for var_idx in model:
-            if reversed_vars[var_idx].startswith("p") and model[var_idx]:
-                lit = neg(reversed_vars[var_idx])
-                ctr.append(lit)
-        assert len(ctr) == self.board.height * self.board.width
+        for k, placement in self.board.solution_placements(solution):
+            ctr.extend(neg(var) for var in self.placement_vars(k, placement))
         self.add_constraint(ctr)
 
     def get_solution(self, model):
-        reversed_vars = {value: key for (key, value) in self._vars.items()}
-        solution = Solution()
-        for var_id in model:
-            assert var_id in reversed_vars.keys()
-            if reversed_vars[var_id].startswith("p") and model[var_id]:
-                i, j, k, l = self.de_p(reversed_vars[var_id])
-                assert (i, j) not in solution.colors
-                solution.add_color(i, j, k)
-        return solution
+        parts = self.decode_model(model)
+        grid = np.full((self.board.height, self.board.width), EMPTY, dtype=np.uint8)
+        grid[parts[:, 0], parts[:, 1]] = parts[:, 2]
+        # each cell is covered exactly once.
+        assert len(parts) == self.board.num_cells and \
+            np.count_nonzero(grid != EMPTY) == self.board.num_cells
+        return Solution.from_grid(grid, self.board.parity)
 
     def encode_board_constraints(self):
         # Once piece per cell
-        for i in range(self.board.height):
-            for j in range(self.board.width):
-                to_sum = []
-                for k in range(self.board.num_pieces):
-                    for l in range(self.board.pieces[k].num_parts):
-                        to_sum.append(self.p(i, j, k, l))
-                self.add_sum_eq1(to_sum)
+        for i, j in self.board.cells():
+            to_sum = []
+            for k in range(self.board.num_pieces):
+                for l in range(self.board.pieces[k].num_parts):
+                    to_sum.append(self.p(i, j, k, l))
+            self.add_sum_eq1(to_sum, self.cell_amo)
         # One cell per piece:
         for k in range(self.board.num_pieces):
             for l in range(self.board.pieces[k].num_parts):
                 to_sum = []
-                for i in range(self.board.height):
-                    for j in range(self.board.width):
-                        to_sum.append(self.p(i, j, k, l))
-                self.add_sum_eq1(to_sum)
+                for i, j in self.board.cells():
+                    to_sum.append(self.p(i, j, k, l))
+                self.add_sum_eq1(to_sum, self.part_amo)
 
     def encode_piece_constraints(self, piece: Piece):
-        rotations = piece.get_rotations()
-        for i in range(self.board.height):
-            for j in range(self.board.width):
-                # which rotations are valid in (i, j)?
-                valid_rotations = self.board.compute_valid_rotations(i, j, piece, rotations)
-
-                # if no rotations are valid, the piece cannot be in (i, j)
-                if len(valid_rotations) == 0:
-                    self.add_constraint([neg(self.p(i, j, piece.idx, 0))])
-                    return
-
-                # each part is in a valid position relative to part #0 (flipped or not)
-                # pos0 -> (pos1 \/ pos1 \/ pos1 \/ ...)
-                for l in range(1, piece.num_parts):
-                    abs_pos_0 = self.p(i, j, piece.idx, 0)
-                    rel_pos_l = [r[1][l] for r in valid_rotations]
-                    # abs_pos_l contains all possible position variables for part l, considering
-                    # the valid rotations.
-                    abs_pos_l = [self.p(i + pos[0], j + pos[1], piece.idx, l)
-                                 for pos in rel_pos_l]
-                    # if part 0 is in (i, j), then part l must be in a position compatible with one
-                    # of the valid rotations
-                    ctr = [neg(abs_pos_0)]
-                    ctr.extend(abs_pos_l)
+        for i, j in self.board.cells():
+            # which orientations are valid in (i, j)? (within the board, X/O in agreement)
+            valid_orientations = self.board.valid_orientations(i, j, piece)
+
+            # if no orientations are valid, the piece cannot be in (i, j)
+            if len(valid_orientations) == 0:
+                self.add_constraint([neg(self.p(i, j, piece.idx, 0))])
+                continue
+
+            # each part is in a valid position relative to part #0 (flipped or not)
+            # pos0 -> (pos1 \/ pos1 \/ pos1 \/ ...)
+            abs_pos_0 = self.p(i, j, piece.idx, 0)
+            for l in range(1, piece.num_parts):
+                # abs_pos_l contains all possible position variables for part l, considering
+                # the valid orientations.
+                abs_pos_l = [self.p(i + o.positions[l][0], j + o.positions[l][1], piece.idx, l)
+                             for o in valid_orientations]
+                # if part 0 is in (i, j), then part l must be in a position compatible with one
+                # of the valid orientations
+                ctr = [neg(abs_pos_0)]
+                ctr.extend(dict.fromkeys(abs_pos_l))
+                self.add_constraint(ctr)
+
+            # all parts are in the same orientation
+            for orientation in valid_orientations:
+                parts_positions = [(i + p[0], j + p[1]) for p in orientation.positions]
+                # first 2 parts + symbol of 1st part define the orientation
+                # (the symbol was checked by valid_orientations)
+                pos1 = parts_positions[1]
+                pos_remaining = parts_positions[2:]
+                # remaining pieces must comply:
+                # if pos0 and pos1 are these, then the remaining vars must be in this
+                # orientation:
+                for p_idx, part in enumerate(pos_remaining):
+                    l = p_idx + 2
+                    ctr = [neg(abs_pos_0),
+                           neg(self.p(pos1[0], pos1[1], piece.idx, 1)),
+                           self.p(part[0], part[1], piece.idx, l)]
                     self.add_constraint(ctr)
 
-                # all parts are in the same rotation
-                for rotation in valid_rotations:
-                    # piece is not flipped
-                    parts_positions = [(i + p[0], j + p[1]) for p in rotation[1]]
-                    # first 2 parts + symbol of 1st part define the rotation:
-                    o0_piece = not piece.os[0] if rotation[0] else piece.os[0]
-                    o0_board = self.board.is_o(i, j)
-                    # We create the clause only if this rotation can be in (i,j) i.e.,
-                    # if o0_piece and o0_board agree
-                    if o0_piece != o0_board:
-                        continue
-                    pos0 = parts_positions[0]
-                    pos1 = parts_positions[1]
-                    pos_remaining = parts_positions[2:]
-                    # remaining pieces must comply:
-                    # if pos0 and pos1 are these, and symbol is in agreement (checked before),
-                    # then the remaining vars must be in one of the valid non-flipped rotations:
-                    for p_idx, part in enumerate(pos_remaining):
-                        l = p_idx + 2
-                        ctr = [neg(self.p(pos0[0], pos0[1], piece.idx, 0)),
-                               neg(self.p(pos1[0], pos1[1], piece.idx, 1)),
-                               self.p(part[0], part[1], piece.idx, l)]
-                        self.add_constraint(ctr)
+    def encode_symmetry_breaking(self):
+        """ Keep only one solution of each set of symmetric solutions (see Board.symmetries):
+        the reference piece may only be in its canonical placements (see
+        Board.canonical_placements). Part 0 may only be in canonical cells, and the other
+        placements there, which a symmetry fixing the cell maps to a smaller one, are ruled out
+        one by one. Board.symmetric_solutions gives back the other solutions. """
+        reference = self.board.reference_piece()
+        if len(self.board.symmetries()) == 1 or reference is None:
+            return
+        canonical_cells = self.board.canonical_cells()
+        for i, j in self.board.cells():
+            if (i, j) not in canonical_cells:
+                for var in self.part_vars(i, j, reference.idx, 0):
+                    self.add_constraint([neg(var)])
+        canonical_placements = self.board.canonical_placements(reference)
+        for placement in self.board.placements(reference):
+            if placement[0] in canonical_cells and placement not in canonical_placements:
+                self.add_constraint([neg(var)
+                                     for var in self.placement_vars(reference.idx, placement)])
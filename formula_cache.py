@@ -0,0 +1,112 @@
+import gc
+import hashlib
+import inspect
+import json
+import os
+
+import numpy as np
+
+from board import Board
+from encoder import Encoder
+from piece import Piece
+
+# bump when the files' layout changes.
+cache_version = 1
+
+
+def cache_key(encoder: Encoder) -> str:
+    """ Content address of an encoder's formula: everything it depends on, i.e., the board's
+    size and pieces, the encoder's class and options, and the source code of the encoder classes
+    and of the board and piece modules, which give the placements and orientations (so that
+    changing an encoding or the placements invalidates the formulas cached with it). """
+    sources = [inspect.getsource(cls) for cls in type(encoder).__mro__ if cls is not object]
+    sources += [inspect.getsource(inspect.getmodule(cls)) for cls in (Board, Piece)]
+    data = {"version": cache_version,
+            "encoder": type(encoder).__name__,
+            "options": encoder.options(),
+            "board": encoder.board.rows(),
+            "pieces": [(piece.coords, piece.os) for piece in encoder.board.pieces],
+            "sources": hashlib.sha256(''.join(sources).encode()).hexdigest()}
+    return hashlib.sha256(json.dumps(data, sort_keys=True).encode()).hexdigest()[:24]
+
+
+def split_clauses(flat: np.ndarray) -> list:
+    """ Inverse of flattening: returns the 0-terminated clauses in flat as lists of ints.
+    Consecutive clauses of the same size (most of them, in our formulas) are converted as one
+    2D block, which is much faster than slicing them one by one. """
+    ends = np.flatnonzero(flat == 0)
+    if len(ends) == 0:
+        return []
+    starts = np.concatenate(([0], ends[:-1] + 1))
+    sizes = ends - starts + 1  # with the terminating 0.
+    bounds = np.concatenate(([0], np.flatnonzero(np.diff(sizes)) + 1, [len(sizes)])).tolist()
+    clauses = []
+    # the collector would traverse all these lists over and over while they are being created.
+    gc_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        for first, last in zip(bounds, bounds[1:]):
+            size, start = int(sizes[first]), int(starts[first])
+            block = np.asarray(flat[start:start + size * (last - first)])
+            clauses.extend(block.reshape(last - first, size)[:, :-1].tolist())
+    finally:
+        if gc_enabled:
+            gc.enable()
+    return clauses
+
+
+class FormulaCache:
+    """ Directory of encoded formulas. Each formula is stored as a flat int32 array of clauses,
+    each one terminated by 0 as in DIMACS (KEY.npy, can be memory-mapped), next to the variable
+    counts and auxiliary variable names (KEY.json). """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def paths(self, key: str) -> tuple:
+        return os.path.join(self.directory, key + '.npy'), os.path.join(self.directory,
+                                                                        key + '.json')
+
+    def load(self, encoder: Encoder) -> bool:
+        """ Fill encoder with its cached formula. Returns false if it is not in the cache. """
+        clauses_path, meta_path = self.paths(cache_key(encoder))
+        if not os.path.exists(clauses_path) or not os.path.exists(meta_path):
+            return False
+        with open(meta_path) as f:
+            meta = json.load(f)
+        if meta["num_p_vars"] != encoder.num_p_vars:
+            return False
+        constraints = split_clauses(np.load(clauses_path, mmap_mode='r'))
+        encoder.load_formula(constraints, meta["num_vars"],
+                             {int(var): name for var, name in meta["aux_names"].items()})
+        return True
+
+    def store(self, encoder: Encoder):
+        """ Store the formula of an encoder, which must have been encoded. """
+        clauses_path, meta_path = self.paths(cache_key(encoder))
+        flat = np.fromiter((lit for ctr in encoder.constraints for lit in ctr + [0]),
+                           dtype=np.int32)
+        # write to temporary files and rename, so that concurrent readers never see half a file.
+        tmp_suffix = f'.{os.getpid()}.tmp'
+        with open(clauses_path + tmp_suffix, 'wb') as f:
+            np.save(f, flat)
+        with open(meta_path + tmp_suffix, 'w') as f:
+            json.dump({"num_vars": encoder.num_vars, "num_p_vars": encoder.num_p_vars,
+                       "num_clauses": len(encoder.constraints),
+                       "aux_names": encoder.aux_names()}, f)
+        os.replace(clauses_path + tmp_suffix, clauses_path)
+        os.replace(meta_path + tmp_suffix, meta_path)
+
+
+def encode_cached(encoder: Encoder, cache: FormulaCache = None) -> bool:
+    """ Encode with encoder, reusing the cached formula if there is one (and caching it
+    otherwise). Returns true on a cache hit. """
+    if cache is None:
+        encoder.encode()
+        return False
+    if cache.load(encoder):
+        return True
+    encoder.encode()
+    cache.store(encoder)
+    return False
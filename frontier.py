@@ -0,0 +1,138 @@
+from collections import OrderedDict
+from typing import Iterator, Optional
+
+from board import Board
+from counting import SolutionCounter
+from solution import Solution
+
+# default number of states kept by the memo of FrontierDP.
+default_memo_size = 1 << 20
+
+
+class FrontierDP(SolutionCounter):
+    """ Enumerates the solutions of a board with the states and counts of SolutionCounter: a
+    state is the set of covered cells (the frontier: all the cells before the first free one
+    are covered) and the set of pieces used so far. The counts are kept in a memo of at most
+    memo_size states, evicting the least recently used; evicted states are counted again when
+    needed. Enumerating only follows placements that lead to at least one solution, so it never
+    backtracks over dead ends. """
+
+    def __init__(self, board: Board, symmetry_breaking: bool = False,
+                 memo_size: int = default_memo_size):
+        """ symmetry_breaking restricts the placements as in dlx.exact_cover. """
+        self.reference = board.reference_piece() if symmetry_breaking else None
+        self.canonical = board.canonical_placements(self.reference) \
+            if self.reference is not None else None
+        super().__init__(board)
+        self.memo_size = memo_size
+        self.memo = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def allows(self, k: int, placement: tuple) -> bool:
+        return self.reference is None or k != self.reference.idx or \
+            placement in self.canonical
+
+    def lookup(self, key: tuple):
+        ret = self.memo.get(key)
+        if ret is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+            self.memo.move_to_end(key)
+        return ret
+
+    def store(self, key: tuple, count: int):
+        self.memo[key] = count
+        if len(self.memo) > self.memo_size:
+            self.memo.popitem(last=False)
+            self.evictions += 1
+
+    def blocked_placements(self, blocked: list) -> list:
+        """ The solutions in blocked that this search can find, as frozensets of
+        (k, frozenset of cells) tuples. """
+        allowed = {(k, frozenset(placement)) for placements in self.placements
+                   for k, _, _, placement in placements}
+        ret = []
+        for solution in blocked:
+            placements = frozenset((k, frozenset(placement))
+                                   for k, placement in self.board.solution_placements(solution))
+            if placements <= allowed:
+                ret.append(placements)
+        return ret
+
+    def search(self, covered: int = 0, used: int = 0, partial: list = None,
+               blocked: list = None) -> Iterator[list]:
+        """ Yields the solutions that complete the state (covered, used), as lists of
+        (k, placement) tuples. Placements that lead to no solution are skipped, as told by
+        count, and so are those that only lead to solutions in blocked (as given by
+        blocked_placements): the solutions of a state are all blocked when as many blocked
+        solutions contain the placements that led to it as count says it has. """
+        if partial is None:
+            partial = []
+        if covered == self.all_cells:
+            if used == self.all_pieces:
+                yield list(partial)
+            return
+        for k, piece_bit, mask, placement in self.placements[self.first_free(covered)]:
+            if piece_bit & used != 0 or mask & covered != 0:
+                continue
+            num_solutions = self.count(covered | mask, used | piece_bit)
+            if num_solutions == 0:
+                continue
+            child_blocked = None
+            if blocked:
+                cells = (k, frozenset(placement))
+                child_blocked = [placements for placements in blocked if cells in placements]
+                if len(child_blocked) == num_solutions:
+                    continue
+            partial.append((k, placement))
+            yield from self.search(covered | mask, used | piece_bit, partial, child_blocked)
+            partial.pop()
+
+    def solutions(self, num_max_solutions: Optional[int] = None, fixed: tuple = None,
+                  blocked: list = None) -> Iterator[Solution]:
+        """ Yields the solutions, up to num_max_solutions of them, as Solution objects, skipping
+        those in blocked (as given by blocked_placements). If fixed is a (k, placement) tuple,
+        only the solutions with piece k in that placement: the search starts from the state
+        where it is the only placement, and as states do not depend on how they were reached,
+        the memo is shared by the searches of all fixed placements. """
+        covered, used, partial = 0, 0, []
+        if fixed is not None:
+            k, cells = fixed[0], frozenset(map(tuple, fixed[1]))
+            match = [(piece_bit, mask, placement) for placements in self.placements
+                     for idx, piece_bit, mask, placement in placements
+                     if idx == k and frozenset(placement) == cells]
+            if len(match) == 0:
+                return
+            used, covered, placement = match[0]
+            partial = [(k, placement)]
+            blocked = [placements for placements in blocked or [] if (k, cells) in placements]
+        for num_solutions, placements in enumerate(self.search(covered, used, partial, blocked)):
+            if num_max_solutions is not None and num_solutions >= num_max_solutions:
+                return
+            yield to_solution(self.board, placements)
+
+    def __str__(self):
+        return f"{len(self.memo)} states in memo, {self.hits} hits, {self.misses} misses, " \
+               f"{self.evictions} evictions"
+
+
+def to_solution(board: Board, placements: list) -> Solution:
+    """ The solution with the (k, placement) tuples given by FrontierDP.search. """
+    solution = Solution(board.height, board.width, board.parity)
+    for k, placement in placements:
+        for i, j in placement:
+            solution.add_color(i, j, k)
+    return solution
+
+
+def solutions(board: Board, num_max_solutions: Optional[int] = None,
+              symmetry_breaking: bool = False, fixed: tuple = None,
+              memo_size: int = default_memo_size, blocked: list = None) -> Iterator[Solution]:
+    """ Yields the solutions of board, up to num_max_solutions of them, as Solution objects, as
+    dlx.solutions does. The solutions in blocked (e.g., found by a previous run) are skipped
+    without searching them again. """
+    dp = FrontierDP(board, symmetry_breaking, memo_size)
+    yield from dp.solutions(num_max_solutions, fixed, dp.blocked_placements(blocked or []))
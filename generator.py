@@ -0,0 +1,261 @@
+import argparse
+import os
+import time
+from dataclasses import dataclass
+from itertools import combinations
+from typing import Iterator
+
+import numpy as np
+
+import dlx
+from board import Board
+from challenge import ChallengeSolver, board_grid
+from checkpoint import read_solutions
+from parallel import pool_backend, run_pool
+from piece import load_pieces, pieces_file
+from placement_encoder import PlacementEncoder
+from solution import EMPTY, Solution
+from solution_store import SolutionStore
+from solvers import backends
+
+solutions_dir = "solutions/"
+challenges_dir = "challenges/"
+
+# grade of a challenge by the size of the search tree that dancing links needs to solve it and
+# to prove that its solution is unique: (maximum number of nodes, grade), then hardest_grade.
+grades = [(20, "easy"), (100, "medium"), (500, "hard")]
+hardest_grade = "expert"
+
+
+def grade(nodes: int) -> str:
+    for max_nodes, name in grades:
+        if nodes <= max_nodes:
+            return name
+    return hardest_grade
+
+
+@dataclass
+class Challenge:
+    """ A challenge made from a solution: the pieces in clues are placed as in the solution,
+    and the others must be placed by the player. nodes measures its difficulty (see grades). """
+    clues: tuple
+    partial: Solution
+    nodes: int
+
+    @property
+    def grade(self) -> str:
+        return grade(self.nodes)
+
+
+@dataclass
+class GeneratorResult:
+    """ The challenges made from solution #index: one per minimal clue set. checks counts the
+    clue sets considered, and calls the solver calls that the cache could not spare. """
+    index: int
+    solution: Solution
+    challenges: list
+    checks: int
+    calls: int
+    elapsed: float
+
+    def __str__(self):
+        sizes = sorted({len(challenge.clues) for challenge in self.challenges})
+        ret = f"{len(self.challenges)} minimal clue sets"
+        if len(sizes) > 0:
+            hardest = max(self.challenges, key=lambda challenge: challenge.nodes)
+            ret += f" of {', '.join(map(str, sizes))} pieces, hardest {hardest.grade} " \
+                   f"({hardest.nodes} nodes)"
+        return ret + f", {self.checks} checks, {self.calls} solver calls, {self.elapsed:.2f}s"
+
+
+class ClueSets:
+    """ Tells which sets of pieces of a solution (as bit masks of piece numbers), placed as in the
+    solution, leave a challenge with a unique solution. This is monotone: adding pieces to such
+    a set keeps the solution unique, and removing pieces from the set of pieces where another
+    solution agrees with this one leaves at least two solutions. So the unique sets and the
+    agreements of the other solutions found so far answer most questions without the solver. """
+
+    def __init__(self, solver: ChallengeSolver, solution: Solution):
+        self.solver = solver
+        self.board = solver.board
+        self.grid = board_grid(self.board, solution)
+        self.unique_sets = []
+        self.agreements = []
+        self.checks = 0
+        self.calls = 0
+
+    def partial(self, clues: int) -> Solution:
+        """ The challenge with the pieces in clues. """
+        grid = self.grid.copy()
+        grid[~np.isin(grid, [k for k in range(self.board.num_pieces) if clues >> k & 1])] = EMPTY
+        return Solution.from_grid(grid, self.board.parity)
+
+    def agreement(self, other: Solution) -> int:
+        """ The pieces placed in the same cells in other as in the solution. """
+        other_grid = board_grid(self.board, other)
+        return sum(1 << k for k in range(self.board.num_pieces)
+                   if np.array_equal(self.grid == k, other_grid == k))
+
+    def is_unique(self, clues: int) -> bool:
+        self.checks += 1
+        if any(unique & ~clues == 0 for unique in self.unique_sets):
+            return True
+        if any(clues & ~agreement == 0 for agreement in self.agreements):
+            return False
+        result = self.solver.solve(self.partial(clues))
+        self.calls += result.calls
+        if result.status == "unsolvable":
+            raise ValueError("Not a solution of the board.")
+        if result.unique:
+            self.unique_sets.append(clues)
+            return True
+        other = next(solution for solution in result.solutions
+                     if not np.array_equal(board_grid(self.board, solution), self.grid))
+        self.agreements.append(self.agreement(other))
+        return False
+
+    def reduce(self, order: list = None) -> int:
+        """ Removes the pieces one by one, in the given order (by default, by piece number),
+        unless the challenge would no longer be unique. Returns the clue set left, which is
+        minimal. """
+        clues = (1 << self.board.num_pieces) - 1
+        for k in order if order is not None else range(self.board.num_pieces):
+            if self.is_unique(clues & ~(1 << k)):
+                clues &= ~(1 << k)
+        return clues
+
+    def minimal(self, max_clues: int = None) -> list:
+        """ All minimal clue sets with up to max_clues pieces, smallest first. Sets are tried by
+        size, so a set that contains a unique set found before is not minimal. """
+        ret = []
+        n = self.board.num_pieces
+        for size in range(min(n, max_clues if max_clues is not None else n) + 1):
+            for pieces in combinations(range(n), size):
+                clues = sum(1 << k for k in pieces)
+                if not any(unique & ~clues == 0 for unique in ret) and self.is_unique(clues):
+                    ret.append(clues)
+        return ret
+
+
+class ChallengeGenerator:
+    """ Makes challenges from the solutions of a board, with one warm ChallengeSolver for all of
+    them. """
+
+    def __init__(self, board: Board, encoder_class=PlacementEncoder, backend: str = 'pysat',
+                 solver: str = None, encoder_options: dict = None):
+        self.board = board
+        self.solver = ChallengeSolver(board, encoder_class, backend, solver, encoder_options)
+        self.cover, _ = dlx.exact_cover(board)
+
+    def difficulty(self, partial: Solution) -> int:
+        """ Nodes of the dancing links search of the cells and pieces left by partial (the
+        columns of its pieces are covered, as if it had been pruned). """
+        columns = [col for k, placement in self.board.solution_placements(partial, partial=True)
+                   for col in [int(self.board.cell_index[i, j]) for i, j in placement] +
+                   [self.board.num_cells + k]]
+        self.cover.cover_columns(columns)
+        start = self.cover.nodes
+        for _ in self.cover.search():
+            pass
+        self.cover.uncover_columns(columns)
+        return self.cover.nodes - start
+
+    def generate(self, solution: Solution, max_clues: int = None, index: int = 0,
+                 greedy: bool = False) -> GeneratorResult:
+        """ The challenges of all minimal clue sets of solution, up to max_clues pieces, or, if
+        greedy, of the single one found by ClueSets.reduce (with max_clues ignored), which takes
+        at most one check per piece. """
+        start_time = time.time()
+        clue_sets = ClueSets(self.solver, solution)
+        challenges = []
+        for clues in [clue_sets.reduce()] if greedy else clue_sets.minimal(max_clues):
+            partial = clue_sets.partial(clues)
+            challenges.append(Challenge(tuple(k for k in range(self.board.num_pieces)
+                                              if clues >> k & 1),
+                                        partial, self.difficulty(partial)))
+        return GeneratorResult(index, solution, challenges, clue_sets.checks, clue_sets.calls,
+                               time.time() - start_time)
+
+    def close(self):
+        self.solver.close()
+
+
+def _setup_generator(board: Board, encoder_class, encoder_options: dict, backend: str,
+                     solver) -> dict:
+    return {"generator": ChallengeGenerator(board, encoder_class, pool_backend(backend), solver,
+                                            encoder_options)}
+
+
+def _generate(state: dict, index: int, grid: np.ndarray, max_clues: int,
+              greedy: bool) -> GeneratorResult:
+    generator = state["generator"]
+    return generator.generate(Solution.from_grid(grid, generator.board.parity), max_clues, index,
+                              greedy)
+
+
+def generate_parallel(board: Board, solutions: list, jobs: int, encoder_class=PlacementEncoder,
+                      encoder_options: dict = None, backend: str = 'pysat', solver: str = None,
+                      max_clues: int = None, greedy: bool = False) -> Iterator[GeneratorResult]:
+    """ Makes the challenges of each solution in a pool of jobs processes, each with its own
+    warm solver, and yields the results as they complete. """
+    yield from run_pool(_setup_generator,
+                        (board, encoder_class, encoder_options or {}, backend, solver),
+                        _generate, [(index, solution.grid, max_clues, greedy)
+                                    for index, solution in enumerate(solutions)], jobs)
+
+
+def read_cmd_args():
+    argparser = argparse.ArgumentParser(
+        description='Make challenges from solutions, one per minimal clue set.')
+    argparser.add_argument('--store', metavar='FILE',
+                           help=f'Read the solutions from the solution store FILE instead of '
+                                f'{solutions_dir}.')
+    argparser.add_argument('-o', '--output', metavar='DIR', default=challenges_dir,
+                           help=f'Write the challenges to DIR (default: {challenges_dir}).')
+    argparser.add_argument('--max-clues', type=int,
+                           help='Only look for clue sets of up to this many pieces.')
+    argparser.add_argument('--greedy', action='store_true',
+                           help='Make one challenge per solution, removing the pieces one by one '
+                                'while the solution stays unique (much faster).')
+    argparser.add_argument('-j', '--jobs', type=int, default=1,
+                           help='Number of processes (0 for one per CPU).')
+    argparser.add_argument('-b', '--backend', choices=list(backends), default='pysat',
+                           help='Solver backend of each process (default: pysat).')
+    argparser.add_argument('--solver', help='Solver of the backend.')
+    argparser.add_argument('--board', metavar='FILE',
+                           help="Board drawn in FILE (default: a 10x5 rectangle).")
+    argparser.add_argument('--pieces', metavar='FILE', default=pieces_file,
+                           help='Pieces, one per line, as in pieces.txt (the default).')
+    return argparser.parse_args()
+
+
+if __name__ == '__main__':
+    args = read_cmd_args()
+    piece_set = load_pieces(args.pieces)
+    if args.board is not None:
+        board = Board.from_file(args.board, piece_set=piece_set)
+    else:
+        board = Board(width=10, height=5, piece_set=piece_set)
+    solutions = list(SolutionStore(args.store)) if args.store is not None else \
+        read_solutions(solutions_dir)
+    jobs = args.jobs if args.jobs > 0 else os.cpu_count()
+    print(f"# making challenges from {len(solutions)} solutions in {jobs} processes...")
+    os.makedirs(args.output, exist_ok=True)
+    start_time = time.time()
+    num_challenges = 0
+    with open(os.path.join(args.output, 'challenges.txt'), 'w') as index_file:
+        for result in generate_parallel(board, solutions, jobs, backend=args.backend,
+                                        solver=args.solver, max_clues=args.max_clues,
+                                        greedy=args.greedy):
+            print(f"# solution #{result.index}: {result}")
+            for n, challenge in enumerate(result.challenges):
+                if len(challenge.clues) == 0:
+                    # the board has a single solution: there is nothing to place nor to write.
+                    print(f"# solution #{result.index} is the only one: no clues needed.")
+                    continue
+                filename = f'challenge_{result.index:03}_{n:02}.out'
+                challenge.partial.dump(os.path.join(args.output, filename))
+                index_file.write(f"{filename} {len(challenge.clues)} {challenge.nodes} "
+                                 f"{challenge.grade}\n")
+                num_challenges += 1
+    print(f"# {num_challenges} challenges in {time.time() - start_time:.2f}s.")
@@ -3,31 +3,41 @@ import argparse
 import glob
 import os
 import socket
-import subprocess
 import sys
 import time
 from dataclasses import dataclass
 from typing import Optional
 
+import dlx
+import frontier
 from board import Board
-from encoder import Encoder
-
-
-def sign(lit): return lit[0] == '-'
-
-
-def var(lit): return lit[1:] if lit[0] == '-' else lit
-
+from challenge import ChallengeSolver, solve_pruned
+from checkpoint import CheckpointLog, read_solutions
+from counting import count_solutions
+from encoder import Encoder, amo_encodings
+from formula_cache import FormulaCache, encode_cached
+from parallel import ParallelStats, enumerate_parallel
+from piece import load_pieces, pieces_file
+from pipeline import Pipeline
+from placement_encoder import PlacementEncoder
+from render import Renderer
+from solution import Solution
+from solution_store import SolutionStore
+from solvers import backends, make_backend
 
 config: Optional["Configurations"] = None
-solver = "cadical"
 solutions = set()
+checkpoint_log: Optional[CheckpointLog] = None
+solution_store: Optional[SolutionStore] = None
+renderer: Optional[Renderer] = None
 num_max_solutions = 1000
+encoders = {"parts": Encoder, "placements": PlacementEncoder}
 
 inesc_servers = ["centaurus", "musca", "octans", "scutum", "spica", "serpens", "sextans", "crux",
                  "crater", "corvus", "dorado"]
 solutions_dir = "solutions/"
 pretty_representations_dir = "/home/macf/public_html/xoxo/configs/"
+formula_cache_dir = ".formula_cache/"
 
 
 @dataclass
@@ -38,6 +48,28 @@ class Configurations:
     store_solution: bool
     all_models: bool
     debug: bool
+    dump_cnf: Optional[str]
+    backend: str
+    solver: Optional[str]
+    symmetry_breaking: bool
+    expand_symmetries: bool
+    encoder: str
+    engine: str
+    jobs: int
+    cell_amo: str
+    part_amo: str
+    formula_cache: Optional[str]
+    resume: bool
+    checkpoint: Optional[str]
+    store: Optional[str]
+    svg_dir: Optional[str]
+    pipeline: bool
+    board: Optional[str]
+    pieces: str
+    challenge: Optional[str]
+    prune: bool
+    count: bool
+    memo_size: int
 
 
 def ready_dirs():
@@ -50,23 +82,25 @@ def ready_dirs():
     if config.store_solution:
         if not os.path.exists(solutions_dir):
             os.makedirs(solutions_dir)
-        else:
+        elif not config.resume:
             files = glob.glob(solutions_dir + '*.out')
             if len(files) > 0:
-                input(f"Do you want to remove {len(files)} files in "
-                      f"{solutions_dir} [y|n]? ")
-                if 'y':
+                answer = input(f"Do you want to remove {len(files)} files in "
+                               f"{solutions_dir} [y|n]? ")
+                if answer.strip().lower().startswith('y'):
                     for file in files:
                         os.remove(file)
+    if config.svg_dir is not None:
+        os.makedirs(config.svg_dir, exist_ok=True)
     if config.show_solution and socket.gethostname() in inesc_servers:
         if not os.path.exists(pretty_representations_dir):
             os.makedirs(pretty_representations_dir)
         else:
             files = glob.glob(pretty_representations_dir + '*.svg')
             if len(files) > 0:
-                input(f"Do you want to remove {len(files)} files in "
-                      f"{pretty_representations_dir} [y|n]? ")
-                if 'y':
+                answer = input(f"Do you want to remove {len(files)} files in "
+                               f"{pretty_representations_dir} [y|n]? ")
+                if answer.strip().lower().startswith('y'):
 
                     for file in files:
                         os.remove(file)
@@ -91,54 +125,6 @@ def nice_time(total_seconds):
     return ret
 
 
-def get_model(lines):
-    """ Returns a dict from positive integer DIMACS var ids to bools. """
-    vals = dict()
-    found = False
-    for line in lines:
-        line = line.rstrip()
-        if not line:
-            continue
-        if not line.startswith('v ') and not line.startswith('V '):
-            continue
-        found = True
-        vs = line.split()[1:]
-        for v in vs:
-            if v == '0':
-                break
-            vals[int(var(v))] = not sign(v)
-    return vals if found else None
-
-
-def send_to_solver(cnf: str):
-    """ Pipe a DIMACS string to solver. """
-    global config
-    print(f"# sending to solver '{solver}'...", end=' ')
-    start_time = time.time()
-    p = subprocess.Popen(solver, shell=True, stdin=subprocess.PIPE, stdout=subprocess.PIPE,
-                         stderr=subprocess.PIPE)
-    po, pe = p.communicate(input=bytes(cnf, encoding='utf-8'))
-    print(f"took {nice_time(time.time() - start_time)}.")
-    print("# decoding result from solver...", end=' ')
-    start_time = time.time()
-    rc = p.returncode
-    s_out = str(po, encoding='utf-8').splitlines()
-    s_err = str(pe, encoding='utf-8').split()
-    if config.debug:
-        print('\n'.join(s_out), file=sys.stderr)
-        print(cnf, file=sys.stderr)
-        print(s_out)
-    print(f"took {nice_time(time.time() - start_time)}.")
-
-    if rc == 10:
-        model = get_model(s_out)
-        return 1, model
-    elif rc == 20:
-        return 0, None
-    else:
-        return None
-
-
 def read_cmd_args():
     """ Reads options from command line arguments.
     Stores them in config, a global Configurations  object. """
@@ -153,18 +139,108 @@ def read_cmd_args():
     argparser.add_argument('-c', '--print-constraints', action='store_true',
                            help='Print all encoded constraints.')
     argparser.add_argument('-d', '--debug', action='store_true', help='Debug solver')
+    argparser.add_argument('--dump-cnf', metavar='FILE',
+                           help='Also write the CNF sent to the solver to FILE.')
+    argparser.add_argument('-b', '--backend', choices=list(backends),
+                           help='Solver backend: a new solver process per call (subprocess, the '
+                                'default), one incremental in-process solver (pysat, the default '
+                                'with --challenge), or a warm incremental solver in a worker '
+                                'process (worker).')
+    argparser.add_argument('-i', '--incremental', action='store_const', const='pysat',
+                           dest='backend', help='Same as --backend pysat.')
+    argparser.add_argument('--solver',
+                           help='Solver command for the subprocess backend (default: cadical), or '
+                                'PySAT solver name for the others (default: cadical153).')
+    argparser.add_argument('-y', '--symmetry-breaking', action='store_true',
+                           help='Only look for one solution of each set of symmetric solutions.')
+    argparser.add_argument('--expand-symmetries', action='store_true',
+                           help='Also output the symmetric copies of each solution found.')
+    argparser.add_argument('-e', '--encoder', choices=list(encoders),
+                           help='Encoding: one variable per part of a piece in a cell (parts, the '
+                                'default), or one variable per placement of a whole piece '
+                                '(placements, the default with --challenge).')
+    argparser.add_argument('--engine', choices=['sat', 'dlx', 'dp'], default='sat',
+                           help='Search with a SAT solver (sat), with dancing links (dlx), or with '
+                                'dynamic programming over the covered cells (dp).')
+    argparser.add_argument('-j', '--jobs', type=int, default=1,
+                           help='With --all-models, split the search by the placement of one '
+                                'piece and solve the parts in JOBS processes (0: one per core).')
+    argparser.add_argument('--cell-amo', choices=list(amo_encodings), default='pairwise',
+                           help='At-most-one encoding for the "one piece per cell" constraints.')
+    argparser.add_argument('--part-amo', choices=list(amo_encodings), default='pairwise',
+                           help='At-most-one encoding for the "one cell per part" constraints '
+                                '("one placement per piece" with -e placements).')
+    argparser.add_argument('--formula-cache', metavar='DIR', nargs='?', const=formula_cache_dir,
+                           help='Reuse the formulas encoded before, cached in DIR '
+                                f'(default: {formula_cache_dir}).')
+    argparser.add_argument('-r', '--resume', action='store_true',
+                           help=f'Continue a previous run: skip (block) the solutions stored in '
+                                f'{solutions_dir}, in the checkpoint log and in the store.')
+    argparser.add_argument('--checkpoint', metavar='FILE',
+                           help='Append each new solution to FILE, to be able to --resume.')
+    argparser.add_argument('--store', metavar='FILE',
+                           help='Append each new solution to the packed solution store FILE (see '
+                                'solution_store.py).')
+    argparser.add_argument('--svg', metavar='DIR', dest='svg_dir',
+                           help='Write an SVG of each solution to DIR, in background processes '
+                                '(see render.py).')
+    argparser.add_argument('--board', metavar='FILE',
+                           help="Board drawn in FILE with X's and O's, and '.' where there is no "
+                                "cell (default: a 10x5 rectangle).")
+    argparser.add_argument('--pieces', metavar='FILE', default=pieces_file,
+                           help='Pieces, one per line, as in pieces.txt (the default).')
+    argparser.add_argument('-p', '--pipeline', action='store_true',
+                           help='With --all-models, decode and output the solutions in other '
+                                'threads while the solver looks for the next one.')
+    argparser.add_argument('--challenge', metavar='FILE',
+                           help="Solve the challenge in FILE, a solution with '.' for the cells "
+                                "of the pieces to place, and tell whether its solution is unique.")
+    argparser.add_argument('--prune', action='store_true',
+                           help='With --challenge, encode only the cells and pieces left to '
+                                'place.')
+    argparser.add_argument('--count', action='store_true',
+                           help='Count the solutions, and the solutions up to symmetry, without '
+                                'enumerating them (see counting.py).')
+    argparser.add_argument('--memo-size', type=int, default=frontier.default_memo_size,
+                           help='Number of states kept by the dp engine (see frontier.py).')
     args = argparser.parse_args()
+    # challenges are a couple of calls with assumptions: a warm solver and small formula win.
+    if args.backend is None:
+        args.backend = 'pysat' if args.challenge is not None else 'subprocess'
+    if args.encoder is None:
+        args.encoder = 'placements' if args.challenge is not None else 'parts'
 
     config = Configurations(args.print_constraints, args.print_model, args.show_solution,
-                            args.store_solution, args.all_models, args.debug)
+                            args.store_solution, args.all_models, args.debug, args.dump_cnf,
+                            args.backend, args.solver, args.symmetry_breaking,
+                            args.expand_symmetries, args.encoder, args.engine,
+                            args.jobs if args.jobs > 0 else os.cpu_count(), args.cell_amo,
+                            args.part_amo, args.formula_cache, args.resume, args.checkpoint,
+                            args.store, args.svg_dir, args.pipeline, args.board, args.pieces,
+                            args.challenge, args.prune, args.count,
+                            args.memo_size)
 
 
-def handle_sat(model: dict, encoder, elapsed):
+def handle_sat(model, encoder, elapsed):
     """ Print everything after a positive reply from the solver. """
     solution = encoder.get_solution(model)
     if config.print_model:
         encoder.print_model(model)
+    handle_found(solution, encoder.board, elapsed)
+
+
+def handle_found(solution, board: Board, elapsed):
+    """ Handle a solution found by the search and, if asked, its symmetric copies. """
     print("SAT")
+    handle_solution(solution, elapsed)
+    if config.expand_symmetries:
+        for other in board.symmetric_solutions(solution):
+            print("# Symmetric copy:")
+            handle_solution(other, elapsed)
+
+
+def handle_solution(solution, elapsed):
+    """ Print, store and show a solution, unless it was found before. """
     print(f"# Solution #{len(solutions) + 1} after {nice_time(elapsed)}:")
     print(solution)
     print(f"# End of solution #{len(solutions) + 1}. "
@@ -176,31 +252,249 @@ def handle_sat(model: dict, encoder, elapsed):
         filename = solutions_dir + f'xoxo_{len(solutions):03}.out'
         print(f"# Saving solution to {filename}...")
         solution.dump(filename)
-    if config.show_solution:
-        if socket.gethostname() in inesc_servers:
-            filename = pretty_representations_dir + f'xoxo_{len(solutions):03}.svg'
-            solution.show(filename)
-        else:
-            solution.show()
+    if renderer is not None:
+        svg_dir = config.svg_dir if config.svg_dir is not None else pretty_representations_dir
+        renderer.submit(solution, os.path.join(svg_dir, f'xoxo_{len(solutions):03}.svg'))
+    elif config.show_solution:
+        solution.show()
     solutions.add(solution)
+    if checkpoint_log is not None:
+        checkpoint_log.append(solution)
+    if solution_store is not None:
+        solution_store.append(solution)
+        solution_store.flush()
+
+
+def resume(board: Board) -> list:
+    """ Returns the solutions of board found by previous runs, stored in solutions_dir, in the
+    checkpoint log or in the solution store, and marks them as found. Anything else there
+    (e.g., a file cut short) is left out. """
+    found = read_solutions(solutions_dir)
+    if checkpoint_log is not None:
+        found.extend(checkpoint_log.read())
+    if solution_store is not None:
+        found.extend(solution_store)
+    resumed = []
+    for solution in found:
+        if not board.is_solution(solution):
+            print(f"# not a solution of this board, ignored:\n{repr(solution)}")
+            continue
+        solution.parity = board.parity
+        if solution not in solutions:
+            solutions.add(solution)
+            resumed.append(solution)
+    print(f"# resuming after {len(resumed)} solutions.")
+    return resumed
+
+
+def encoder_options() -> dict:
+    """ Encoder options given in the command line. """
+    return {"cell_amo": config.cell_amo, "part_amo": config.part_amo}
+
+
+def main_dlx(board: Board, blocked: list):
+    """ Search for solutions with dancing links instead of a SAT solver, except for those in
+    blocked. """
+    print("# searching with dancing links...")
+    start_time = time.time()
+    num_found = 0
+    limit = num_max_solutions if config.all_models else 1
+    for solution in dlx.solutions(board, limit, config.symmetry_breaking, blocked=blocked):
+        num_found += 1
+        handle_found(solution, board, time.time() - start_time)
+    if num_found == 0:
+        print("UNSAT")
+    if config.all_models:
+        print(f"# {num_found} found, {len(solutions)} distinct solutions in "
+              f"{nice_time(time.time() - start_time)}.")
+
+
+def main_dp(board: Board, blocked: list):
+    """ Search for solutions with the frontier dynamic programming engine, except for those in
+    blocked. """
+    print("# searching with frontier dp...")
+    start_time = time.time()
+    dp = frontier.FrontierDP(board, config.symmetry_breaking, memo_size=config.memo_size)
+    num_found = 0
+    limit = num_max_solutions if config.all_models else 1
+    for placements in dp.search(blocked=dp.blocked_placements(blocked)):
+        if num_found >= limit:
+            break
+        num_found += 1
+        handle_found(frontier.to_solution(board, placements), board, time.time() - start_time)
+    if num_found == 0:
+        print("UNSAT")
+    if config.all_models:
+        print(f"# {num_found} found, {len(solutions)} distinct solutions in "
+              f"{nice_time(time.time() - start_time)}.")
+    print(f"# {dp}")
+
+
+def main_parallel(board: Board, blocked: list):
+    """ Enumerate all solutions in a process pool, merging the solutions of each part. """
+    print(f"# enumerating with {config.engine} in {config.jobs} processes...")
+    start_time = time.time()
+    stats = ParallelStats()
+    num_found = 0
+    parts = enumerate_parallel(board, config.jobs, config.engine, encoders[config.encoder],
+                               encoder_options(), config.backend, config.solver,
+                               config.symmetry_breaking, num_max_solutions, config.formula_cache,
+                               blocked)
+    for part in parts:
+        stats.add(part)
+        for solution in part.solutions:
+            num_found += 1
+            handle_found(solution, board, time.time() - start_time)
+        if len(solutions) + 1 >= num_max_solutions:
+            parts.close()
+            break
+    elapsed = time.time() - start_time
+    print(f"# {num_found} found, {len(solutions)} distinct solutions in {nice_time(elapsed)}.")
+    print(stats)
+
+
+def main_pipelined(encoder, backend):
+    """ Enumerate all solutions, with the solver in this thread and the decoding and output of
+    the models in a pipeline, see pipeline.Pipeline. Only blocking a model must be done before
+    the next call to the solver. """
+    start_time = time.time()
+
+    def decode(item):
+        model, elapsed = item
+        return encoder.get_solution(model), model, elapsed
+
+    def output(item):
+        solution, model, elapsed = item
+        if config.print_model:
+            encoder.print_model(model)
+        handle_found(solution, encoder.board, elapsed)
+
+    print(f"# All solutions, solving with '{backend.name}'.")
+    stages = Pipeline([decode, output])
+    num_sat_calls = 0
+    num_resumed = len(solutions)
+    try:
+        result, model = backend.solve()
+        while result == 1 and num_resumed + num_sat_calls + 1 < num_max_solutions:
+            num_sat_calls += 1
+            encoder.block_model(model)
+            stages.put((model, time.time() - start_time))
+            result, model = backend.solve()
+    finally:
+        stages.close()
+    if result is None:
+        print("ERROR: something went wrong with the solver")
+    print("# End of all solutions.")
+    print(f"# {num_sat_calls} models, {len(solutions)} distinct solutions in "
+          f"{nice_time(time.time() - start_time)}.")
+
+
+def main_challenge(board: Board):
+    """ Solve a challenge, i.e., a partial solution, and check that its solution is unique. """
+    partial = Solution()
+    partial.read(config.challenge, partial=True)
+    print(f"# solving challenge {config.challenge}...")
+    solver = None
+    try:
+        if config.prune:
+            result = solve_pruned(board, partial, encoders[config.encoder], config.backend,
+                                  config.solver, encoder_options())
+        else:
+            solver = ChallengeSolver(board, encoders[config.encoder], config.backend,
+                                     config.solver, encoder_options())
+            result = solver.solve(partial)
+    except ValueError as e:
+        print(f"ERROR: not a challenge of this board: {e}")
+        return
+    except (RuntimeError, OSError) as e:
+        # the solver gave no answer, or could not be started.
+        print(f"ERROR: something went wrong with the solver: {e}")
+        sys.exit(1)
+    finally:
+        if solver is not None:
+            solver.close()
+    for solution in result.solutions:
+        handle_found(solution, board, result.elapsed)
+    print(f"# {result}")
+
+
+def main_count(board: Board):
+    """ Count the solutions with a memoised exact cover counter. """
+    print("# counting solutions...")
+    result = count_solutions(board)
+    print(f"# {result.solutions} solutions, {result.orbits} up to symmetry, in "
+          f"{nice_time(result.elapsed)}.")
+    print(f"# {result}")
 
 
 def main():
-    global solutions, num_max_solutions
-    board = Board(width=10, height=5)
-    encoder = Encoder(board)
+    global solutions, num_max_solutions, checkpoint_log, solution_store, renderer
+    piece_set = load_pieces(config.pieces)
+    if config.board is not None:
+        board = Board.from_file(config.board, piece_set=piece_set)
+    else:
+        board = Board(width=10, height=5, piece_set=piece_set)
+    print(f"# {board.width}x{board.height} board with {board.num_cells} cells and "
+          f"{board.num_pieces} pieces.")
+    if config.checkpoint is not None:
+        checkpoint_log = CheckpointLog(config.checkpoint)
+    if config.store is not None:
+        solution_store = SolutionStore(config.store, board.height, board.width)
+    if config.svg_dir is not None or \
+            (config.show_solution and socket.gethostname() in inesc_servers):
+        renderer = Renderer(jobs=config.jobs)
+    if config.count:
+        main_count(board)
+        return
+    if config.challenge is not None:
+        main_challenge(board)
+        return
+    blocked = resume(board) if config.resume else []
+    if config.all_models and config.jobs > 1:
+        main_parallel(board, blocked)
+        return
+    if config.engine == 'dlx':
+        main_dlx(board, blocked)
+        return
+    if config.engine == 'dp':
+        main_dp(board, blocked)
+        return
+    encoder = encoders[config.encoder](board, symmetry_breaking=config.symmetry_breaking,
+                                       **encoder_options())
     print(f"# encoding with {encoder.__class__.__name__}...", end=' ')
     start_time = time.time()
-    encoder.encode()
-    print(f"took {nice_time(time.time() - start_time)}.")
+    cache = FormulaCache(config.formula_cache) if config.formula_cache is not None else None
+    cached = encode_cached(encoder, cache)
+    print(f"took {nice_time(time.time() - start_time)}{' (cached)' if cached else ''}.")
+    for solution in blocked:
+        encoder.block_solution(solution)
+    print(f"# {encoder.num_vars} variables, {len(encoder.constraints)} clauses.")
 
     if config.print_constraints:
         print("# Encoded constraints")
         encoder.print_constraints()
         print("# End encoded constraints")
 
+    if config.backend == 'subprocess':
+        backend = make_backend(config.backend, encoder, config.solver, dump_cnf=config.dump_cnf,
+                               debug=config.debug)
+    else:
+        backend = make_backend(config.backend, encoder, config.solver)
+
+    def solve():
+        print(f"# solving with '{backend.name}'...", end=' ')
+        ret = backend.solve()
+        print(f"took {nice_time(backend.stats.last_time)}.")
+        return ret
+
+    if config.all_models and config.pipeline:
+        main_pipelined(encoder, backend)
+        print(f"# {backend.name}: {backend.stats}")
+        backend.close()
+        return
+
     start_time = time.time()
-    result, model = send_to_solver(encoder.make_dimacs())
+    result, model = solve()
     if not config.all_models:
         if result == 1:
             assert model is not None
@@ -227,15 +521,26 @@ def main():
                 print("# End of encoded constraints")
 
             # get new model
-            result, model = send_to_solver(encoder.make_dimacs())
+            result, model = solve()
         elapsed = time.time() - start_time
         print("# End of all solutions.")
         print(f"# {num_sat_calls} models, {len(solutions)} distinct solutions in "
               f"{nice_time(elapsed)}.")
+    print(f"# {backend.name}: {backend.stats}")
+    backend.close()
 
 
 if __name__ == '__main__':
     read_cmd_args()
     ready_dirs()
     assert config is not None
-    main()
+    try:
+        main()
+    finally:
+        if checkpoint_log is not None:
+            checkpoint_log.close()
+        if solution_store is not None:
+            solution_store.close()
+        if renderer is not None:
+            renderer.close()
+            print(f"# {renderer.num_rendered} solutions rendered.")
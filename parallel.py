@@ -0,0 +1,161 @@
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dataclasses import dataclass, field
+from typing import Iterator
+
+import dlx
+import frontier
+from board import Board
+from formula_cache import FormulaCache, encode_cached
+from solvers import make_backend
+
+# State of each pool process, set up once by _init_pool and passed to all its tasks.
+_state = {}
+
+
+@dataclass
+class PartResult:
+    """ Solutions of one subproblem: the solutions with piece k in placement. """
+    pid: int
+    k: int
+    placement: tuple
+    solutions: list
+    elapsed: float
+
+
+@dataclass
+class WorkerStats:
+    parts: int = 0
+    solutions: int = 0
+    busy_time: float = 0.0
+
+    def __str__(self):
+        rate = self.solutions / self.busy_time if self.busy_time > 0 else 0.0
+        return f"{self.parts} subproblems, {self.solutions} solutions in " \
+               f"{self.busy_time:.2f}s ({rate:.1f} solutions/s)"
+
+
+@dataclass
+class ParallelStats:
+    workers: dict = field(default_factory=dict)  # pid -> WorkerStats
+
+    def add(self, result: PartResult):
+        stats = self.workers.setdefault(result.pid, WorkerStats())
+        stats.parts += 1
+        stats.solutions += len(result.solutions)
+        stats.busy_time += result.elapsed
+
+    def __str__(self):
+        return '\n'.join(f"# worker {pid}: {stats}" for pid, stats in sorted(self.workers.items()))
+
+
+def split_placements(board: Board, symmetry_breaking: bool = False) -> list:
+    """ Splits the search into independent subproblems, one per placement of one piece, and
+    returns them as (k, placement) tuples. The piece is the reference piece when breaking
+    symmetries (so that only its canonical placements are needed, see
+    Board.canonical_placements), otherwise the piece with
+    the most placements. """
+    piece = board.reference_piece() if symmetry_breaking else None
+    if piece is None:
+        piece = max(board.pieces, key=lambda p: len(board.placements(p)))
+        symmetry_breaking = False
+    placements = board.placements(piece)
+    if symmetry_breaking:
+        canonical = board.canonical_placements(piece)
+        placements = [placement for placement in placements if placement in canonical]
+    return [(piece.idx, placement) for placement in placements]
+
+
+def pool_backend(backend: str) -> str:
+    """ Backend of the solvers in pool processes: they cannot start their own worker processes,
+    and are warm workers already. """
+    return 'pysat' if backend == 'worker' else backend
+
+
+def _init_pool(setup, setup_args: tuple):
+    _state.update(setup(*setup_args))
+
+
+def _run_task(task, args: tuple):
+    return task(_state, *args)
+
+
+def run_pool(setup, setup_args: tuple, task, tasks: list, jobs: int) -> Iterator:
+    """ Runs task(state, *args) for each args in tasks in a pool of jobs processes, and yields
+    the results as they complete. Each process calls setup(*setup_args) once, which returns
+    its state (a dict, e.g., with a warm solver) for all its tasks. setup and task must be
+    module-level functions. Closing the generator cancels the tasks that have not started. """
+    executor = ProcessPoolExecutor(max_workers=jobs, initializer=_init_pool,
+                                   initargs=(setup, setup_args))
+    try:
+        futures = [executor.submit(_run_task, task, args) for args in tasks]
+        for future in as_completed(futures):
+            yield future.result()
+    finally:
+        executor.shutdown(cancel_futures=True)
+
+
+def _setup_worker(board: Board, engine: str, encoder_class, encoder_options: dict, backend: str,
+                  solver, symmetry_breaking: bool, formula_cache: str, blocked: list) -> dict:
+    state = dict(board=board, engine=engine, symmetry_breaking=symmetry_breaking,
+                 blocked=blocked)
+    if engine == 'sat':
+        encoder = encoder_class(board, symmetry_breaking=symmetry_breaking, **encoder_options)
+        encode_cached(encoder, FormulaCache(formula_cache) if formula_cache is not None else None)
+        for solution in blocked:
+            encoder.block_solution(solution)
+        state['encoder'] = encoder
+        state['backend'] = make_backend(pool_backend(backend), encoder, solver)
+    elif engine == 'dp':
+        # one memo for all the subproblems of this worker (see FrontierDP.solutions).
+        dp = frontier.FrontierDP(board, symmetry_breaking)
+        state['dp'] = dp
+        state['blocked'] = dp.blocked_placements(blocked)
+    return state
+
+
+def _enumerate_part(state: dict, k: int, placement: tuple,
+                    num_max_solutions: int) -> PartResult:
+    start_time = time.time()
+    found = []
+    if state['engine'] == 'dlx':
+        found = list(dlx.solutions(state['board'], num_max_solutions,
+                                   state['symmetry_breaking'], fixed=(k, placement),
+                                   blocked=state['blocked']))
+    elif state['engine'] == 'dp':
+        found = list(state['dp'].solutions(num_max_solutions, (k, placement),
+                                           state['blocked']))
+    else:
+        encoder, backend = state['encoder'], state['backend']
+        # Blocking clauses are added for good: each solution belongs to a single subproblem.
+        assumptions = encoder.placement_vars(k, placement)
+        result, model = backend.solve(assumptions)
+        while result == 1 and len(found) < num_max_solutions:
+            found.append(encoder.get_solution(model))
+            encoder.block_model(model)
+            result, model = backend.solve(assumptions)
+    return PartResult(os.getpid(), k, placement, found, time.time() - start_time)
+
+
+def enumerate_parallel(board: Board, jobs: int, engine: str, encoder_class=None,
+                       encoder_options: dict = None, backend: str = None, solver: str = None,
+                       symmetry_breaking: bool = False,
+                       num_max_solutions: int = 1000,
+                       formula_cache: str = None,
+                       blocked: list = None) -> Iterator[PartResult]:
+    """ Enumerates the solutions of board in a pool of jobs processes, one subproblem per
+    placement given by split_placements, and yields the results as they complete. Closing the
+    generator cancels the subproblems that have not started. With a formula_cache directory,
+    the workers load the encoded formula from it (see formula_cache), so that it is only encoded
+    once. The solutions in blocked (e.g., found by a previous run) are not enumerated again. """
+    parts = split_placements(board, symmetry_breaking)
+    if engine == 'sat' and formula_cache is not None:
+        # encode it here, not in each of the workers at the same time.
+        encode_cached(encoder_class(board, symmetry_breaking=symmetry_breaking,
+                                    **(encoder_options or {})), FormulaCache(formula_cache))
+    yield from run_pool(_setup_worker,
+                        (board, engine, encoder_class, encoder_options or {}, backend, solver,
+                         symmetry_breaking, formula_cache, blocked or []),
+                        _enumerate_part, [(k, placement, num_max_solutions)
+                                          for k, placement in parts], jobs)
@@ -1,24 +1,85 @@
+from dataclasses import dataclass
 from itertools import combinations
+from os import path
 
 import numpy as np
-from matplotlib import pyplot as plt
 from termcolor import colored
 
 term_colors = ["red", "green", "yellow", "blue", "magenta", "cyan"]
 
+# orientation tables, computed once per shape: (coords, os) -> list of Orientation.
+_orientations_cache = {}
+
+# the standard pieces, and the (coords, os) of the pieces in each piece file read so far.
+pieces_file = path.join(path.dirname(path.abspath(__file__)), 'pieces.txt')
+_piece_sets = {}
+
+
+@dataclass(frozen=True)
+class Orientation:
+    """ A rotation of a piece, flipped or not. positions has the (i, j) of each part relative
+    to part #0, and os tells whether each part shows an 'O' facing up. The bounding box is
+    relative to part #0 too. """
+    flipped: bool
+    positions: tuple
+    os: tuple
+    min_i: int
+    max_i: int
+    min_j: int
+    max_j: int
+
+    @property
+    def o0(self) -> bool:
+        """ Returns true if part #0 shows an 'O', i.e., if it must be placed where is_o. """
+        return self.os[0]
+
+
+def parse_piece(text: str) -> tuple:
+    """ Returns the (coords, os) of a piece given by its rows separated by '/', with X and O for
+    its parts and '.' for empty squares, as in pieces.txt. Parts are numbered row by row, and
+    coords are relative to part #0 (see Orientation), which is not in the first column if the
+    first row starts with '.'. """
+    coords = []
+    os = []
+    for i, row in enumerate(text.strip().split('/')):
+        for j, c in enumerate(row):
+            if c in 'XO':
+                coords.append([i, j])
+                os.append(c == 'O')
+            elif c != '.':
+                raise ValueError(f"Unexpected '{c}' in piece {text}.")
+    if len(coords) == 0:
+        raise ValueError(f"Piece {text} has no parts.")
+    i0, j0 = coords[0]
+    return [[i - i0, j - j0] for i, j in coords], os
+
+
+def load_pieces(filename: str = pieces_file) -> list:
+    """ Returns the pieces in a piece file, numbered from 0. Empty lines and lines starting with
+    '#' are ignored. """
+    if filename not in _piece_sets:
+        with open(filename) as f:
+            lines = [line.strip() for line in f]
+        _piece_sets[filename] = [parse_piece(line) for line in lines
+                                 if len(line) > 0 and not line.startswith('#')]
+    return [Piece(idx, coords, os) for idx, (coords, os) in enumerate(_piece_sets[filename])]
+
 
 class Piece:
-    def __init__(self, idx: int):
-        assert 0 <= idx <= 9, f"id is {idx}"
-        self.num_parts = 5
-        self.os = []
-        self.coords = []
+    def __init__(self, idx: int, coords: list = None, os: list = None):
+        """ Piece idx of the standard set in pieces.txt, unless its coords and os are given. """
+        if coords is None:
+            standard = _piece_sets.get(pieces_file)
+            if standard is None:
+                load_pieces()
+                standard = _piece_sets[pieces_file]
+            assert 0 <= idx < len(standard), f"id is {idx}"
+            coords, os = standard[idx]
+        self.coords = [list(coord) for coord in coords]
+        self.os = list(os)
+        self.num_parts = len(self.coords)
         self.idx = idx
 
-        # DIRTY, UGLY HACK!! Pieces are hardcoded.
-        init_method = self.__getattribute__(f"init_{idx}")
-        init_method()
-
         for x1, x2 in combinations(range(len(self.coords)), 2):
             pos1, pos2 = self.coords[x1], self.coords[x2]
             distance = (pos1[0] - pos2[0]) ** 2 + (pos1[1] - pos2[1]) ** 2
@@ -28,46 +89,6 @@ class Piece:
         # debug:
         # self.show()
 
-    def init_0(self):
-        self.coords = [[0, 0], [0, 1], [1, 1], [2, 1], [2, 2]]
-        self.os = [False, True, False, True, False]
-
-    def init_1(self):
-        self.coords = [[0, 0], [0, 1], [0, 2], [1, 1], [2, 1]]
-        self.os = [True, False, True, True, False]
-
-    def init_2(self):
-        self.coords = [[0, 0], [0, 1], [0, 2], [1, 0], [1, 2]]
-        self.os = [False, True, False, True, True]
-
-    def init_3(self):
-        self.coords = [[0, 0], [0, 1], [0, 2], [0, 3], [0, 4]]
-        self.os = [True, False, True, False, True]
-
-    def init_4(self):
-        self.coords = [[0, 0], [0, 1], [1, 1], [1, 2], [2, 2]]
-        self.os = [False, True, False, True, False]
-
-    def init_5(self):
-        self.coords = [[0, 0], [0, 1], [0, 2], [0, 3], [1, 0]]
-        self.os = [True, False, True, False, False]
-
-    def init_6(self):
-        self.coords = [[0, 0], [0, 1], [0, 2], [1, 2], [1, 3]]
-        self.os = [True, False, True, False, True]
-
-    def init_7(self):
-        self.coords = [[0, 0], [0, 1], [0, 2], [1, 0], [1, 1]]
-        self.os = [True, False, True, False, True]
-
-    def init_8(self):
-        self.coords = [[0, 0], [0, 1], [0, 2], [1, 2], [2, 2]]
-        self.os = [True, False, True, False, True]
-
-    def init_9(self):
-        self.coords = [[0, 0], [0, 1], [0, 2], [0, 3], [1, 2]]
-        self.os = [True, False, True, False, False]
-
     def __str__(self):
         ret = ''
         for i in range(max(map(lambda c: c[0], self.coords)) + 1):
@@ -82,6 +103,7 @@ class Piece:
         return ret[:-1]
 
     def show(self):
+        from matplotlib import pyplot as plt  # slow to import, and only needed here.
         data = []
         max_i = max(1, max(map(lambda coord: coord[0], self.coords)))
         max_j = max(1, max(map(lambda coord: coord[1], self.coords)))
@@ -114,9 +136,62 @@ class Piece:
                              )
         plt.title(f"Piece #{self.idx}")
         plt.show(bbox_inches='tight', pad_inches=0)
+        plt.close()
         # plt.savefig(fname=f"p{self.idx}.pdf", format="pdf", bbox_inches='tight', pad_inches=0)
 
+    @staticmethod
+    def normalise(positions) -> tuple:
+        """ Shape of a list of positions, ignoring part labels: sorted and moved to the origin. """
+        min_i = min(map(lambda coord: coord[0], positions))
+        min_j = min(map(lambda coord: coord[1], positions))
+        return tuple(sorted((coord[0] - min_i, coord[1] - min_j) for coord in positions))
+
+    @staticmethod
+    def normalise_labelled(positions, os) -> tuple:
+        """ Like normalise, for parts that show an 'O' or not (os): the sorted (i, j, o) of the
+        parts, moved to the origin. """
+        min_i = min(map(lambda coord: coord[0], positions))
+        min_j = min(map(lambda coord: coord[1], positions))
+        return tuple(sorted((int(coord[0] - min_i), int(coord[1] - min_j), o)
+                            for coord, o in zip(positions, os)))
+
+    def is_asymmetric(self) -> bool:
+        """ Returns true if no rotation or flip, other than the identity, maps the piece's shape
+        to itself. """
+        return len({self.normalise(o.positions) for o in self.orientations}) == 8
+
+    @property
+    def orientations(self) -> list:
+        """ Returns the distinct orientations of the piece (see Orientation). Orientations that
+        cover the same cells as an earlier one, with an 'O' on the same cells, are left out:
+        they only number the parts differently (e.g., OXOXO turned by 180 degrees). Turning
+        OX by 180 degrees gives XO, which covers the same cells with X's and O's swapped: that
+        is another orientation. """
+        key = (tuple(map(tuple, self.coords)), tuple(self.os))
+        if key not in _orientations_cache:
+            orientations = []
+            seen = set()
+            for flipped, positions in self.all_rotations():
+                os = tuple(o != flipped for o in self.os)
+                shape = self.normalise_labelled(positions, os)
+                if shape in seen:
+                    continue
+                seen.add(shape)
+                positions = tuple((int(pos[0]), int(pos[1])) for pos in positions)
+                orientations.append(Orientation(flipped, positions, os,
+                                                min(pos[0] for pos in positions),
+                                                max(pos[0] for pos in positions),
+                                                min(pos[1] for pos in positions),
+                                                max(pos[1] for pos in positions)))
+            _orientations_cache[key] = orientations
+        return _orientations_cache[key]
+
     def get_rotations(self):
+        """ Returns the distinct orientations of the piece as tuples (flipped, coordinates),
+        where flipped is a bool and coordinates a list. """
+        return [(o.flipped, [list(pos) for pos in o.positions]) for o in self.orientations]
+
+    def all_rotations(self):
         """ Returns alternate sets of coordinates for pieces, considering all possible rotations.
         Solution is a tuple (flipped, coordinates), where flipped is a bool and coordinates a
         list. """
@@ -0,0 +1,53 @@
+import queue
+import threading
+
+# marks the end of the items in a queue.
+_end = object()
+
+
+class Pipeline:
+    """ Chain of stages, each one a function that runs in its own thread and takes the items
+    returned by the previous one (None drops an item). Stages are connected by bounded queues,
+    so put blocks when the stages fall behind (back-pressure) instead of letting the items pile
+    up. Items keep their order. """
+
+    def __init__(self, stages: list, maxsize: int = 64):
+        self.queues = [queue.Queue(maxsize) for _ in stages]
+        self.error = None
+        self.threads = []
+        for n, stage in enumerate(stages):
+            out = self.queues[n + 1] if n + 1 < len(stages) else None
+            thread = threading.Thread(target=self._run, args=(stage, self.queues[n], out),
+                                      daemon=True)
+            thread.start()
+            self.threads.append(thread)
+
+    def _run(self, stage, inp: queue.Queue, out: queue.Queue):
+        while True:
+            item = inp.get()
+            if item is not _end and self.error is None:
+                try:
+                    item = stage(item)
+                except BaseException as e:
+                    self.error = e
+                    item = None
+                if item is not None and out is not None:
+                    out.put(item)
+            elif item is _end:
+                if out is not None:
+                    out.put(_end)
+                return
+
+    def put(self, item):
+        """ Feed an item to the first stage. Raises the error of a failed stage, if any. """
+        if self.error is not None:
+            raise self.error
+        self.queues[0].put(item)
+
+    def close(self):
+        """ Wait for all items to go through the stages. """
+        self.queues[0].put(_end)
+        for thread in self.threads:
+            thread.join()
+        if self.error is not None:
+            raise self.error
@@ -0,0 +1,72 @@
+from board import Board
+from encoder import Encoder
+
+
+class PlacementEncoder(Encoder):
+    """ Exact cover encoding: there is one variable per placement of a piece, i.e., per piece,
+    cell of its part #0 and orientation, and only for the placements that agree with the board's
+    X's and O's (see Board.placements). Each cell is covered by exactly one placement and each
+    piece has exactly one placement: cell_amo and part_amo select the at-most-one encodings for
+    each of these families. """
+
+    def __init__(self, board: Board, symmetry_breaking: bool = False, cell_amo: str = "pairwise",
+                 part_amo: str = "pairwise"):
+        self.placements = []  # (k, placement) of each variable, at index var - 1.
+        self._placement_var = {}  # (k, frozenset of cells) -> var.
+        self.first_var = []  # first variable of each piece.
+        super().__init__(board, symmetry_breaking, cell_amo, part_amo)
+
+    def init_vars(self):
+        # one var per placement
+        for piece in self.board.pieces:
+            self.first_var.append(len(self.placements) + 1)
+            for placement in self.board.placements(piece):
+                self.placements.append((piece.idx, placement))
+                self._placement_var[(piece.idx, frozenset(placement))] = len(self.placements)
+        self.num_p_vars = len(self.placements)
+        self.num_vars = self.num_p_vars
+
+    def decode_var(self, var: int) -> list:
+        k, placement = self.placements[var - 1]
+        return [(i, j, k, l) for l, (i, j) in enumerate(placement)]
+
+    def model_size(self) -> int:
+        """ Number of true p variables in a model: one placement per piece. """
+        return self.board.num_pieces
+
+    def piece_vars(self, k: int) -> range:
+        """ Returns the variables of the placements of piece k. """
+        end = self.first_var[k + 1] if k + 1 < self.board.num_pieces else self.num_p_vars + 1
+        return range(self.first_var[k], end)
+
+    def part_vars(self, i: int, j: int, k: int, l: int) -> list:
+        return [var for var in self.piece_vars(k) if self.placements[var - 1][1][l] == (i, j)]
+
+    def placement_vars(self, k: int, placement) -> list:
+        return [self._placement_var[(k, frozenset(map(tuple, placement)))]]
+
+    def var_name(self, var: int) -> str:
+        if self.is_p(var):
+            k, placement = self.placements[var - 1]
+            i, j = placement[0]
+            return f"x_{str(k).rjust(len(str(self.board.num_pieces - 1)), '0')}_" \
+                   f"{str(i).rjust(len(str(self.board.max_i)), '0')}_" \
+                   f"{str(j).rjust(len(str(self.board.max_j)), '0')}_{var - self.first_var[k]}"
+        return super().var_name(var)
+
+    def encode(self):
+        self.encode_board_constraints()
+        if self.symmetry_breaking:
+            self.encode_symmetry_breaking()
+
+    def encode_board_constraints(self):
+        # One placement per cell
+        covering = {cell: [] for cell in self.board.cells()}
+        for var, (k, placement) in enumerate(self.placements, start=1):
+            for cell in placement:
+                covering[cell].append(var)
+        for cell in sorted(covering):
+            self.add_sum_eq1(covering[cell], self.cell_amo)
+        # One placement per piece
+        for k in range(self.board.num_pieces):
+            self.add_sum_eq1(list(self.piece_vars(k)), self.part_amo)
@@ -0,0 +1,113 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+
+import numpy as np
+
+from solution import EMPTY, Solution
+
+# matplotlib's Set3 colors, the colormap of Solution.show, which spreads the range of colors of
+# a solution over them (see palette_color).
+palette = ["#8dd3c7", "#ffffb3", "#bebada", "#fb8072", "#80b1d3", "#fdb462", "#b3de69",
+           "#fccde5", "#d9d9d9", "#bc80bd", "#ccebc5", "#ffed6f"]
+cell_size = 40
+
+
+@lru_cache(maxsize=None)
+def svg_template(height: int, width: int, parity: bytes = None) -> tuple:
+    """ SVG of a height x width board, with placeholders {2N} and {2N + 1} for the color and the
+    label of cell N (row by row), and the labels (X's and O's) of the cells. parity is the
+    board's parity (see Board.parity) as bytes, by default the cells with odd i + j. """
+    is_o = np.frombuffer(parity, dtype=bool).reshape(height, width) if parity is not None else \
+        np.indices((height, width)).sum(axis=0) % 2 == 1
+    parts = [f'<svg xmlns="http://www.w3.org/2000/svg" width="{width * cell_size}" '
+             f'height="{height * cell_size}" viewBox="0 0 {width * cell_size} '
+             f'{height * cell_size}">\n'
+             f'<g font-family="sans-serif" font-weight="bold" font-size="{cell_size // 2}" '
+             f'fill="#333333" text-anchor="middle" dominant-baseline="central">\n']
+    labels = []
+    for i in range(height):
+        for j in range(width):
+            x, y = j * cell_size, i * cell_size
+            n = i * width + j
+            parts.append(f'<rect x="{x}" y="{y}" width="{cell_size}" height="{cell_size}" '
+                         f'fill="{{{2 * n}}}"/>'
+                         f'<text x="{x + cell_size // 2}" y="{y + cell_size // 2}">'
+                         f'{{{2 * n + 1}}}</text>\n')
+            labels.append("O" if is_o[i, j] else "X")
+    parts.append('</g>\n</svg>\n')
+    return ''.join(parts), labels
+
+
+def palette_color(color: int, low: int, high: int) -> str:
+    """ The color of the palette for color, when the colors of the solution go from low to high,
+    as imshow picks it: the range is scaled to [0, 1], then to the entries of the palette. """
+    if high == low:
+        return palette[0]
+    return palette[min(int((color - low) / (high - low) * len(palette)), len(palette) - 1)]
+
+
+def render_svg(grid: np.ndarray, parity: np.ndarray = None) -> str:
+    """ SVG of the solution with colors grid, in the colors of Solution.show. EMPTY cells (not
+    on the board) are left blank. """
+    height, width = grid.shape
+    template, labels = svg_template(height, width, parity.astype(bool).tobytes()
+                                    if parity is not None else None)
+    colors = grid[grid != EMPTY]
+    low, high = (int(colors.min()), int(colors.max())) if colors.size > 0 else (0, 0)
+    args = []
+    for color, label in zip(grid.ravel().tolist(), labels):
+        if color == EMPTY:
+            args.extend(("none", ""))
+        else:
+            args.extend((palette_color(color, low, high), label))
+    return template.format(*args)
+
+
+def render_batch(batch: list) -> int:
+    """ Writes each (grid, parity, filename) in batch. Returns how many. """
+    for grid, parity, filename in batch:
+        tmp_filename = filename + '.tmp'
+        with open(tmp_filename, 'w') as f:
+            f.write(render_svg(grid, parity))
+        os.replace(tmp_filename, filename)
+    return len(batch)
+
+
+class Renderer:
+    """ Writes SVG files of solutions in a pool of processes, batch_size solutions per task, so
+    that rendering does not slow down the search. close waits for all of them. """
+
+    def __init__(self, jobs: int = 1, batch_size: int = 16):
+        self.batch_size = batch_size
+        self.executor = ProcessPoolExecutor(max_workers=jobs)
+        self.batch = []
+        self.futures = []
+        self.num_rendered = 0
+
+    def submit(self, solution: Solution, filename: str):
+        solution.check_solution()
+        self.batch.append((solution.grid.copy(), solution.parity, filename))
+        if len(self.batch) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        """ Send the solutions submitted so far to the pool. """
+        if len(self.batch) > 0:
+            self.futures.append(self.executor.submit(render_batch, self.batch))
+            self.batch = []
+        # collect the finished tasks, to raise their errors early.
+        pending = []
+        for future in self.futures:
+            if future.done():
+                self.num_rendered += future.result()
+            else:
+                pending.append(future)
+        self.futures = pending
+
+    def close(self):
+        self.flush()
+        for future in self.futures:
+            self.num_rendered += future.result()
+        self.futures = []
+        self.executor.shutdown()
@@ -1,73 +1,119 @@
-from matplotlib import pyplot as plt
+import numpy as np
 from termcolor import colored
 
 from piece import term_colors
 
+# color of the cells that have not been set yet, or that are not cells of the board (shown as
+# '.' by __repr__ and dump).
+EMPTY = 255
+# .out files and checkpoints have one digit per cell, so piece numbers are below max_pieces.
+max_pieces = 10
+
 
 class Solution:
-    """ Represents a solution to a XOXO board. """
+    """ Represents a solution to a XOXO board.
+    The colors are kept in a grid of bytes (EMPTY where not set yet), so that comparing and
+    hashing solutions are single vectorised operations. The hash is cached until the solution
+    changes. parity tells which cells show an 'O' (see Board.parity); without it, the cells with
+    odd i + j do. """
     _sol_num: int = 0
 
-    def __init__(self):
-        """ Instantiate an empty solution. """
-        # A solution is represented by a dict of tuples (i, j) (coordinates) to ints (colors).
-        self.colors = {}
+    def __init__(self, height: int = 0, width: int = 0, parity=None):
+        """ Instantiate an empty solution. The grid grows as needed when colors are added, so
+        the dimensions are only a hint. """
+        self.grid = np.full((height, width), EMPTY, dtype=np.uint8)
+        self.parity = None if parity is None else np.array(parity, dtype=bool)
+        self._hash = None
         self.id = Solution._sol_num
-        self.height = None
-        self.width = None
         Solution._sol_num += 1
 
+    @classmethod
+    def from_grid(cls, grid, parity=None) -> "Solution":
+        """ Solution with the colors in a 2D array (or a list of lists) of ints. """
+        solution = cls(parity=parity)
+        solution.grid = np.array(grid, dtype=np.uint8)
+        assert solution.grid.ndim == 2
+        return solution
+
+    @property
+    def height(self) -> int:
+        return self.grid.shape[0]
+
+    @property
+    def width(self) -> int:
+        return self.grid.shape[1]
+
+    @property
+    def colors(self) -> dict:
+        """ The colors of the cells that are set, by (i, j). """
+        return {(i, j): color for i, row in enumerate(self.grid.tolist())
+                for j, color in enumerate(row) if color != EMPTY}
+
     def add_color(self, i: int, j: int, color: int):
         """ Main function to build a solution. Set position (i, j) to color color."""
-        self.colors[(i, j)] = color
+        assert 0 <= color < EMPTY
+        if i >= self.height or j >= self.width:
+            grown = np.full((max(i + 1, self.height), max(j + 1, self.width)), EMPTY,
+                            dtype=np.uint8)
+            grown[:self.height, :self.width] = self.grid
+            self.grid = grown
+        self.grid[i, j] = color
+        self._hash = None
 
     def check_solution(self):
-        max_i = max(map(lambda c: c[0], self.colors.keys()))
-        max_j = max(map(lambda c: c[1], self.colors.keys()))
+        """ Cells can be left EMPTY only on boards that are not rectangles (see Board.mask). """
+        assert self.grid.size > 0 and np.any(self.grid != EMPTY)
 
-        for i in range(max_i + 1):
-            for j in range(max_j + 1):
-                assert (i, j) in self.colors.keys()
-        self.height = max_i + 1
-        self.width = max_j + 1
+    def transform(self, mapping) -> "Solution":
+        """ Returns a new solution with the color of each (i, j) moved to mapping(i, j).
+        mapping must work elementwise on arrays of coordinates (as Board.symmetries do). """
+        self.check_solution()
+        new_i, new_j = mapping(*np.indices(self.grid.shape))
+        grid = np.full((int(new_i.max()) + 1, int(new_j.max()) + 1), EMPTY, dtype=np.uint8)
+        grid[new_i, new_j] = self.grid
+        # symmetries of a board map it to itself, so its parity does not change.
+        other = Solution.from_grid(grid, self.parity if self.parity is not None and
+                                   self.parity.shape == grid.shape else None)
+        other.check_solution()
+        return other
 
     def is_o(self, i: int, j: int) -> bool:
         """ Returns true if board position should have a piece with 'O' facing up."""
+        if self.parity is not None:
+            return bool(self.parity[i, j])
         return (i + j) % 2 == 1
 
     def show(self, filename=None):
-        """ Show a solution using a matplotlib heatmap. """
+        """ Show a solution using a matplotlib heatmap. To write many SVG files, render.py is
+        much faster. """
+        from matplotlib import pyplot as plt  # slow to import, and only needed here.
         self.check_solution()
-        data = []
         plt.figure()
-        for i in range(self.height):
-            data_r = []
-            for j in range(self.width):
-                data_r.append(self.colors[(i, j)])
-            data.append(data_r)
-        plt.imshow(data, cmap="Set3")
+        plt.imshow(np.ma.masked_equal(self.grid, EMPTY), cmap="Set3")
         plt.axis('off')
 
-        for i in range(self.height):
-            for j in range(self.width):
-                is_o = self.is_o(i, j)
-                plt.text(j, i, 'O' if is_o else 'X',
-                         horizontalalignment='center',
-                         verticalalignment='center',
-                         fontweight='bold', size='xx-large', color='0.2'
-                         )
+        for i, j in zip(*np.nonzero(self.grid != EMPTY)):
+            is_o = self.is_o(i, j)
+            plt.text(j, i, 'O' if is_o else 'X',
+                     horizontalalignment='center',
+                     verticalalignment='center',
+                     fontweight='bold', size='xx-large', color='0.2'
+                     )
         if filename is not None and len(filename) > 0:
             plt.savefig(filename,
                         format="svg", bbox_inches='tight', pad_inches=0)
         else:
             plt.show(bbox_inches='tight', pad_inches=0.15)
+        plt.close()
 
     def __str__(self):
         self.check_solution()
         ret = ''
-        for i in range(self.height):
-            for j in range(self.width):
-                k = self.colors[(i, j)]
+        for i, row in enumerate(self.grid.tolist()):
+            for j, k in enumerate(row):
+                if k == EMPTY:
+                    ret += '   '
+                    continue
                 s = colored(str(k) + ("O" if self.is_o(i, j) else "X"),
                             term_colors[k % len(term_colors)])  # +
                 # str(l)
@@ -77,14 +123,14 @@ class Solution:
 
     def __repr__(self):
         self.check_solution()
-        return '\n'.join(map(lambda i: ''.join(
-            map(lambda j: str(self.colors[(i, j)]),
-                range(self.width))),
-                             range(self.height)))
+        return '\n'.join(''.join('.' if k == EMPTY else str(k) for k in row)
+                         for row in self.grid.tolist())
 
     def __hash__(self):
-        self.check_solution()
-        return hash(repr(self))
+        if self._hash is None:
+            self.check_solution()
+            self._hash = hash((self.grid.shape, self.grid.tobytes()))
+        return self._hash
 
     def dump(self, filename=None):
         self.check_solution()
@@ -94,32 +140,34 @@ class Solution:
         else:
             print(repr(self))
 
-    def read(self, filename: str):
+    def read(self, filename: str, partial: bool = False):
         with open(filename, 'r') as f:
-            for i, line in enumerate(f.readlines()):
-                for j, col in enumerate(line.rstrip()):
-                    self.add_color(i, j, int(col))
-        self.check_solution()
+            self.read_rows(f.readlines(), partial)
+
+    def read_rows(self, rows: list, partial: bool = False):
+        """ Build a solution from its rows, as written by dump. If partial (e.g., a challenge),
+        all its cells may be EMPTY. """
+        rows = [line.rstrip() for line in rows if len(line.rstrip()) > 0]
+        if len(rows) == 0 or any(len(row) != len(rows[0]) for row in rows):
+            raise ValueError("Rows of a solution must all have the same length.")
+        self.grid = np.array([[EMPTY if col == '.' else int(col) for col in line] for line in rows],
+                             dtype=np.uint8)
+        self._hash = None
+        if not partial and not np.any(self.grid != EMPTY):
+            raise ValueError("A solution must place at least one piece.")
 
     def distance_to(self, other: "Solution") -> int:
-        count = 0
         self.check_solution()
         other.check_solution()
-        if self.width != other.width or self.height != other.height:
+        if self.grid.shape != other.grid.shape:
             raise ValueError("Solutions cannot be compared.")
-        for i in range(self.height):
-            for j in range(self.width):
-                if self.colors[(i, j)] != other.colors[(i, j)]:
-                    count += 1
-        return count
+        return int(np.count_nonzero(self.grid != other.grid))
 
     def __eq__(self, other: "Solution"):
         self.check_solution()
         other.check_solution()
-        if self.width != other.width or self.height != other.height:
+        if self.grid.shape != other.grid.shape:
             raise ValueError("Solutions cannot be compared.")
-        for i in range(self.height):
-            for j in range(self.width):
-                if self.colors[(i, j)] != other.colors[(i, j)]:
-                    return False
-        return True
+        if self._hash is not None and other._hash is not None and self._hash != other._hash:
+            return False
+        return bool(np.array_equal(self.grid, other.grid))
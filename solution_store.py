@@ -0,0 +1,133 @@
+import argparse
+import glob
+import os
+import struct
+
+import numpy as np
+
+from solution import Solution
+
+# magic, format version, height, width, padding to 16 bytes.
+header_format = '<4sHHH6x'
+header_size = struct.calcsize(header_format)
+magic = b'XOXO'
+version = 1
+
+
+class SolutionStore:
+    """ Append-only file of solutions of one board size: a 16 bytes header with the dimensions,
+    followed by one fixed-width record per solution, with one byte per cell (row by row).
+    Records are appended with a single write each and read back through a memory map. A record
+    cut by a crash is ignored, and overwritten by the next append. """
+
+    def __init__(self, filename: str, height: int = None, width: int = None):
+        """ Open a store, or get ready to create it (when the first solution is appended, if its
+        dimensions are not given). """
+        self.filename = filename
+        self.height = height
+        self.width = width
+        self.f = None
+        self._grids = None
+        if os.path.exists(filename) and os.path.getsize(filename) > 0:
+            with open(filename, 'rb') as f:
+                tag, file_version, file_height, file_width = \
+                    struct.unpack(header_format, f.read(header_size))
+            if tag != magic or file_version != version:
+                raise ValueError(f"{filename} is not a solution store.")
+            if (height, width) not in [(None, None), (file_height, file_width)]:
+                raise ValueError(f"{filename} has {file_width}x{file_height} solutions.")
+            self.height, self.width = file_height, file_width
+
+    @property
+    def record_size(self) -> int:
+        return self.height * self.width
+
+    def __len__(self):
+        if self.height is None or not os.path.exists(self.filename):
+            return 0
+        if self.f is not None:
+            self.f.flush()
+        return (os.path.getsize(self.filename) - header_size) // self.record_size
+
+    def grids(self) -> np.ndarray:
+        """ All solutions, as a read-only (N, height, width) array mapped from the file. """
+        n = len(self)
+        if n == 0:
+            return np.zeros((0, self.height or 0, self.width or 0), dtype=np.uint8)
+        if self._grids is None or len(self._grids) != n:
+            self._grids = np.memmap(self.filename, dtype=np.uint8, mode='r', offset=header_size,
+                                    shape=(n, self.height, self.width))
+        return self._grids
+
+    def __getitem__(self, idx: int) -> Solution:
+        return Solution.from_grid(self.grids()[idx])
+
+    def __iter__(self):
+        grids = self.grids()
+        for idx in range(len(grids)):
+            yield Solution.from_grid(grids[idx])
+
+    def append(self, solution: Solution):
+        solution.check_solution()
+        if self.f is None:
+            self.open_for_append(solution.height, solution.width)
+        if (solution.height, solution.width) != (self.height, self.width):
+            raise ValueError(f"Cannot store a {solution.width}x{solution.height} solution in "
+                             f"{self.filename}.")
+        self.f.write(solution.grid.tobytes())
+
+    def open_for_append(self, height: int, width: int):
+        if self.height is None:
+            self.height, self.width = height, width
+        if not os.path.exists(self.filename) or os.path.getsize(self.filename) == 0:
+            with open(self.filename, 'wb') as f:
+                f.write(struct.pack(header_format, magic, version, self.height, self.width))
+        self.f = open(self.filename, 'rb+')
+        # drop a record cut by a crash.
+        end = header_size + len(self) * self.record_size
+        self.f.truncate(end)
+        self.f.seek(end)
+
+    def flush(self):
+        if self.f is not None:
+            self.f.flush()
+
+    def close(self):
+        if self.f is not None:
+            self.f.close()
+            self.f = None
+
+    def import_out(self, directory: str) -> int:
+        """ Append the solutions in the .out files in directory. Returns how many. """
+        files = sorted(glob.glob(os.path.join(directory, '*.out')))
+        for filename in files:
+            solution = Solution()
+            solution.read(filename)
+            self.append(solution)
+        self.flush()
+        return len(files)
+
+    def export_out(self, directory: str) -> int:
+        """ Write each solution to directory/xoxo_NNN.out, as main.py -t does. Returns how many. """
+        os.makedirs(directory, exist_ok=True)
+        n = 0
+        for n, solution in enumerate(self, start=1):
+            solution.dump(os.path.join(directory, f'xoxo_{n - 1:03}.out'))
+        return n
+
+
+if __name__ == '__main__':
+    argparser = argparse.ArgumentParser(description='Convert between .out files and a store.')
+    argparser.add_argument('command', choices=['import', 'export', 'info'])
+    argparser.add_argument('store', help='Solution store file.')
+    argparser.add_argument('directory', nargs='?', default='solutions/',
+                           help='Directory with .out files (default: solutions/).')
+    args = argparser.parse_args()
+    store = SolutionStore(args.store)
+    if args.command == 'import':
+        print(f"{store.import_out(args.directory)} solutions imported into {args.store}.")
+    elif args.command == 'export':
+        print(f"{store.export_out(args.directory)} solutions exported to {args.directory}.")
+    else:
+        print(f"{args.store}: {len(store)} solutions of {store.width}x{store.height}.")
+    store.close()
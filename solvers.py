@@ -0,0 +1,281 @@
+import io
+import multiprocessing
+import shlex
+import subprocess
+import sys
+import time
+from dataclasses import dataclass, field
+from typing import Optional
+
+import numpy as np
+
+try:
+    from pysat.solvers import Solver
+except ImportError:  # PySAT is optional, only needed for in-process and worker backends.
+    Solver = None
+
+from encoder import Encoder
+
+
+def true_vars(lits, num_p_vars: int) -> np.ndarray:
+    """ Returns the model given by the literals lits, as the array of the p variables (see
+    Encoder.is_p) that are true, in increasing order. This is all that Encoder needs from a
+    model, and is much smaller than the whole assignment. """
+    lits = np.asarray(lits, dtype=np.int64)
+    return np.sort(lits[(lits > 0) & (lits <= num_p_vars)])
+
+
+def parse_output(data: bytes, num_p_vars: int) -> tuple:
+    """ Returns the status in the 's' line of a solver's output (or None), and the model in its
+    'v' lines, as given by true_vars (or None if there are no 'v' lines). The literals are
+    parsed in bulk from the raw bytes. """
+    status = None
+    values = []
+    for line in data.splitlines():
+        if line[:2] in (b'v ', b'V '):
+            values.append(line[2:])
+        elif line[:2] == b's ':
+            status = line[2:].strip().decode('ascii')
+    if len(values) == 0:
+        return status, None
+    return status, true_vars(np.fromstring(b' '.join(values), dtype=np.int64, sep=' '),
+                             num_p_vars)
+
+
+@dataclass
+class SolverStats:
+    """ Timing and statistics, reported in the same way by every backend. """
+    calls: int = 0
+    sat: int = 0
+    unsat: int = 0
+    errors: int = 0
+    clauses_sent: int = 0
+    load_time: float = 0.0  # time spent handing clauses to the solver.
+    solve_time: float = 0.0  # time spent waiting for answers.
+    last_time: float = 0.0  # load + solve time of the last call.
+    solver_stats: dict = field(default_factory=dict)  # solver specific, e.g., conflicts.
+
+    def __str__(self):
+        ret = f"{self.calls} calls ({self.sat} SAT, {self.unsat} UNSAT, {self.errors} errors), " \
+              f"{self.clauses_sent} clauses sent, load {self.load_time:.3f}s, " \
+              f"solve {self.solve_time:.3f}s"
+        if self.calls > 0:
+            ret += f", avg. {(self.load_time + self.solve_time) / self.calls:.3f}s per call"
+        if len(self.solver_stats) > 0:
+            ret += ', ' + ', '.join(f'{k} {v}' for k, v in sorted(self.solver_stats.items()))
+        return ret
+
+
+class SolverBackend:
+    """ Common interface of solver backends. Each backend solves the constraints of an encoder,
+    including the ones added after the backend was created (e.g., blocking clauses). """
+    kind = None
+    default_solver = None
+
+    def __init__(self, encoder: Encoder, solver: Optional[str] = None):
+        self.encoder = encoder
+        self.solver = solver if solver is not None else self.default_solver
+        self.stats = SolverStats()
+
+    @property
+    def name(self):
+        return f"{self.kind}:{self.solver}"
+
+    def solve(self, assumptions=()) -> tuple:
+        """ Returns (1, model) if SAT, (0, None) if UNSAT, and (None, None) if the solver gave no
+        answer. assumptions are literals that must hold for this call only. """
+        start_time = time.time()
+        result, model = self._solve(list(assumptions))
+        self.stats.last_time = time.time() - start_time
+        self.stats.calls += 1
+        if result == 1:
+            self.stats.sat += 1
+        elif result == 0:
+            self.stats.unsat += 1
+        else:
+            self.stats.errors += 1
+        return result, model
+
+    def _solve(self, assumptions: list) -> tuple:
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class SubprocessSolver(SolverBackend):
+    """ Streams the whole formula in DIMACS to a new solver process on each call. The solver is
+    any command that reads DIMACS from stdin and prints the model in 'v' lines, as is standard
+    in the SAT competitions. """
+    kind = "subprocess"
+    default_solver = "cadical"
+
+    def __init__(self, encoder: Encoder, solver: Optional[str] = None,
+                 dump_cnf: Optional[str] = None, debug: bool = False):
+        super().__init__(encoder, solver)
+        self.dump_cnf = dump_cnf
+        self.debug = debug
+
+    def _solve(self, assumptions: list) -> tuple:
+        if self.dump_cnf is not None:
+            with open(self.dump_cnf, 'w') as f:
+                self.encoder.write_dimacs(f)
+        if self.debug:
+            self.encoder.write_dimacs(sys.stderr)
+        # the solver's stderr goes to ours when debugging, so that it never fills a pipe.
+        start_time = time.time()
+        p = subprocess.Popen(shlex.split(self.solver), stdin=subprocess.PIPE,
+                             stdout=subprocess.PIPE,
+                             stderr=None if self.debug else subprocess.DEVNULL)
+        try:
+            stdin = io.TextIOWrapper(p.stdin, encoding='ascii')
+            # assumptions become unit clauses, as there is no later call to retract them from.
+            self.encoder.write_dimacs(stdin, extra=[[lit] for lit in assumptions])
+            stdin.close()
+        except BrokenPipeError:
+            pass  # the solver exited early; its return code tells what happened.
+        self.stats.load_time += time.time() - start_time
+        self.stats.clauses_sent += len(self.encoder.constraints) + len(assumptions)
+
+        start_time = time.time()
+        data = p.stdout.read()
+        rc = p.wait()
+        self.stats.solve_time += time.time() - start_time
+        status, model = parse_output(data, self.encoder.num_p_vars)
+        if self.debug:
+            for line in data.decode('ascii', errors='replace').splitlines():
+                if not line.startswith(('v ', 'V ', 's ')):
+                    print(line, file=sys.stderr)
+
+        if (rc == 10 or status == "SATISFIABLE") and model is not None:
+            return 1, model
+        elif rc == 20 or status == "UNSATISFIABLE":
+            return 0, None
+        else:
+            return None, None
+
+
+def _pysat_stats(solver) -> dict:
+    try:
+        return solver.accum_stats() or {}
+    except NotImplementedError:
+        return {}
+
+
+class PySATSolver(SolverBackend):
+    """ Keeps one in-process SAT solver alive (through PySAT). Constraints added to the encoder
+    since the last call are added to the running solver, so learned clauses are kept between
+    calls. """
+    kind = "pysat"
+    default_solver = "cadical153"
+
+    def __init__(self, encoder: Encoder, solver: Optional[str] = None):
+        if Solver is None:
+            raise ImportError(f"The {self.kind} backend requires PySAT (pip install python-sat).")
+        super().__init__(encoder, solver)
+        start_time = time.time()
+        self.sat_solver = Solver(name=self.solver, bootstrap_with=encoder.constraints)
+        self.stats.load_time += time.time() - start_time
+        self.num_clauses = len(encoder.constraints)
+        self.stats.clauses_sent += self.num_clauses
+
+    def sync(self):
+        """ Add the encoder's constraints that the solver has not seen yet. """
+        start_time = time.time()
+        for ctr in self.encoder.constraints[self.num_clauses:]:
+            self.sat_solver.add_clause(ctr)
+        self.stats.clauses_sent += len(self.encoder.constraints) - self.num_clauses
+        self.num_clauses = len(self.encoder.constraints)
+        self.stats.load_time += time.time() - start_time
+
+    def _solve(self, assumptions: list) -> tuple:
+        self.sync()
+        start_time = time.time()
+        result = self.sat_solver.solve(assumptions=assumptions)
+        self.stats.solve_time += time.time() - start_time
+        self.stats.solver_stats = _pysat_stats(self.sat_solver)
+        if result is True:
+            return 1, true_vars(self.sat_solver.get_model(), self.encoder.num_p_vars)
+        elif result is False:
+            return 0, None
+        else:
+            return None, None
+
+    def close(self):
+        self.sat_solver.delete()
+
+
+def _worker(conn, name: str):
+    """ Main loop of a PersistentSolver's worker process. """
+    solver = Solver(name=name)
+    while True:
+        msg, arg = conn.recv()
+        if msg == "add":
+            solver.append_formula(arg)
+        elif msg == "solve":
+            assumptions, num_p_vars = arg
+            result = solver.solve(assumptions=assumptions)
+            # only the true p variables are sent back.
+            model = true_vars(solver.get_model(), num_p_vars) if result else None
+            conn.send((result, model, _pysat_stats(solver)))
+        elif msg == "close":
+            break
+    solver.delete()
+    conn.close()
+
+
+class PersistentSolver(PySATSolver):
+    """ Keeps a warm PySAT solver in a separate worker process. Clauses are sent once, and only
+    new constraints are sent on later calls. The worker keeps the main process free (and
+    isolated from solver crashes) while it solves. """
+    kind = "worker"
+
+    def __init__(self, encoder: Encoder, solver: Optional[str] = None):
+        if Solver is None:
+            raise ImportError(f"The {self.kind} backend requires PySAT (pip install python-sat).")
+        SolverBackend.__init__(self, encoder, solver)
+        self.conn, child_conn = multiprocessing.Pipe()
+        self.process = multiprocessing.Process(target=_worker, args=(child_conn, self.solver),
+                                               daemon=True)
+        self.process.start()
+        self.num_clauses = 0
+
+    def sync(self):
+        start_time = time.time()
+        new = self.encoder.constraints[self.num_clauses:]
+        if len(new) > 0:
+            self.conn.send(("add", new))
+        self.stats.clauses_sent += len(new)
+        self.num_clauses = len(self.encoder.constraints)
+        self.stats.load_time += time.time() - start_time
+
+    def _solve(self, assumptions: list) -> tuple:
+        self.sync()
+        start_time = time.time()
+        try:
+            self.conn.send(("solve", (assumptions, self.encoder.num_p_vars)))
+            result, model, self.stats.solver_stats = self.conn.recv()
+        except (EOFError, BrokenPipeError):
+            result, model = None, None  # the worker died.
+        self.stats.solve_time += time.time() - start_time
+        if result is True:
+            return 1, model
+        elif result is False:
+            return 0, None
+        else:
+            return None, None
+
+    def close(self):
+        if self.process.is_alive():
+            self.conn.send(("close", None))
+            self.process.join()
+
+
+backends = {backend.kind: backend for backend in [SubprocessSolver, PySATSolver, PersistentSolver]}
+
+
+def make_backend(kind: str, encoder: Encoder, solver: Optional[str] = None, **kwargs):
+    """ Instantiate the backend of the given kind (one of the keys in backends). """
+    if kind not in backends:
+        raise ValueError(f"Unknown solver backend '{kind}'. Choose from {', '.join(backends)}.")
+    return backends[kind](encoder, solver, **kwargs)